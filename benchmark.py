@@ -0,0 +1,342 @@
+"""
+Benchmarks of the simulation, collisions, network inference and packing, and whole
+generations.
+
+Every benchmark uses fixed seeds and a fixed genome set, so two runs on
+the same machine measure the same work and can be compared across
+commits. Results are printed as a table and can be saved as JSON:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+import neat
+import numpy as np
+import pygame
+
+import flappy_bird
+from course import Course
+from population_net import PopulationNetwork, TopologyCache
+from champion import from_network
+
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config-feedforward.txt")
+POPULATION_SIZES = (50, 500, 5000)
+
+# a bird that flies well, the genome set is made of noisy copies of it
+CHAMPION_BIAS = -1.18
+CHAMPION_WEIGHTS = {(-1, 0): 0.0, (-2, 0): 0.358, (-3, 0): -0.752}
+
+
+def load_config(pop_size=None):
+    """
+    :param pop_size: population size, the config file's if None (int)
+    :return: neat config
+    """
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                                neat.DefaultSpeciesSet, neat.DefaultStagnation, CONFIG)
+    if pop_size is not None:
+        config.pop_size = pop_size
+    return config
+
+
+def make_genomes(config, size, seed=1):
+    """
+    builds the same genome set every time: copies of a bird that flies with
+    noise on the weights, and a hidden node added to every fourth one, so
+    some birds die early and some live through the whole budget
+    :param config: neat config
+    :param size: number of genomes (int)
+    :param seed: seed of the noise (int)
+    :return: list of (genome_id, genome) tuples
+    """
+    # neat's mutations draw from the random module
+    state = random.getstate()
+    random.seed(seed)
+    config.genome_config.node_indexer = None
+
+    genomes = []
+    for key in range(1, size + 1):
+        genome = config.genome_type(key)
+        genome.configure_new(config.genome_config)
+        genome.nodes[0].bias = CHAMPION_BIAS + random.gauss(0, 0.1)
+        for connection, weight in CHAMPION_WEIGHTS.items():
+            genome.connections[connection].weight = weight + random.gauss(0, 0.1)
+        if key % 4 == 0:
+            genome.mutate_add_node(config.genome_config)
+        genomes.append((key, genome))
+
+    random.setstate(state)
+    return genomes
+
+
+def measure(function, repeat):
+    """
+    times a function, keeping the fastest of repeat runs like timeit does
+    :param function: function() -> amount of work done (number)
+    :param repeat: number of runs (int)
+    :return: (seconds of the fastest run, work done in it)
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, work)
+    return best
+
+
+def result(name, params, value, unit, seconds):
+    return {"name": name, "params": params, "value": value, "unit": unit, "seconds": seconds}
+
+
+def bench_physics(sizes, frames, repeat):
+    """
+    frames per second of BirdPopulation.move and jump alone, and of the
+    per bird Bird.move for reference
+    """
+    results = []
+
+    def single():
+        bird = flappy_bird.Bird(230, 350)
+        for frame in range(frames):
+            bird.move()
+            if frame % 12 == 0:
+                bird.jump()
+        return frames
+
+    seconds, work = measure(single, repeat)
+    results.append(result("physics.bird", {"birds": 1, "frames": frames}, work / seconds, "frames/s", seconds))
+
+    for size in sizes:
+        rng = np.random.RandomState(1)
+        # every bird jumps on its own schedule
+        phase = rng.randint(0, 12, size)
+
+        def population_frames():
+            population = flappy_bird.BirdPopulation(size, 230, 350)
+            for frame in range(frames):
+                population.move()
+                population.jump(phase == frame % 12)
+            return frames
+
+        seconds, work = measure(population_frames, repeat)
+        results.append(result("physics.population", {"birds": size, "frames": frames},
+                              work / seconds, "frames/s", seconds))
+    return results
+
+
+def bench_collision(count, repeat):
+    """
+    Pipe.collide calls per second, for birds around the pipe's column
+    outside the gap (the pixel check) and inside it (the early out)
+    """
+    results = []
+    rng = random.Random(1)
+    pipe = flappy_bird.Pipe(230, 250)
+    birds = []
+    for _ in range(count):
+        bird = flappy_bird.Bird(rng.uniform(230 - flappy_bird.Bird.WIDTH, 230 + flappy_bird.Pipe.WIDTH), 0)
+        bird.img = rng.choice(flappy_bird.Bird.IMGS)
+        birds.append(bird)
+
+    for case, low, high in (("pixel", -50, 240), ("gap", pipe.height, pipe.bottom - flappy_bird.Bird.HEIGHT)):
+        for bird in birds:
+            bird.y = rng.uniform(low, high)
+
+        def collisions():
+            for bird in birds:
+                pipe.collide(bird, None)
+            return len(birds)
+
+        seconds, work = measure(collisions, repeat)
+        results.append(result("collision." + case, {"calls": count}, work / seconds, "collisions/s", seconds))
+    return results
+
+
+def bench_inference(sizes, calls, repeat):
+    """
+    network activations per second: PopulationNetwork on a whole
+    population at once, neat's FeedForwardNetwork one network at a time,
+    and the exported champion runtime
+    """
+    results = []
+    config = load_config()
+    rng = np.random.RandomState(1)
+
+    for size in sizes:
+        genomes = [genome for genome_id, genome in make_genomes(config, size)]
+        nets = PopulationNetwork.create(genomes, config)
+        inputs = rng.uniform(0, 500, (size, 3))
+
+        def population_activations():
+            for _ in range(calls):
+                nets.activate(inputs)
+            return calls * size
+
+        seconds, work = measure(population_activations, repeat)
+        results.append(result("inference.population", {"networks": size, "calls": calls},
+                              work / seconds, "activations/s", seconds))
+
+    genomes = [genome for genome_id, genome in make_genomes(config, min(sizes))]
+    networks = [neat.nn.FeedForwardNetwork.create(genome, config) for genome in genomes]
+    champions = [from_network(net) for net in networks]
+    inputs = rng.uniform(0, 500, (len(networks), 3)).tolist()
+
+    for name, nets in (("inference.neat", networks), ("inference.champion", champions)):
+        def activations():
+            for _ in range(calls):
+                for net, x in zip(nets, inputs):
+                    net.activate(x)
+            return calls * len(nets)
+
+        seconds, work = measure(activations, repeat)
+        results.append(result(name, {"networks": len(nets), "calls": calls}, work / seconds, "activations/s", seconds))
+    return results
+
+
+def bench_compile(sizes, repeat):
+    """
+    genomes packed per second by PopulationNetwork.create, laying out every
+    topology (cold) and with the topologies of the same genomes cached (warm)
+    """
+    results = []
+    config = load_config()
+    for size in sizes:
+        genomes = [genome for genome_id, genome in make_genomes(config, size)]
+        warm = TopologyCache()
+        PopulationNetwork.create(genomes, config, warm)
+
+        for case, cache in (("cold", TopologyCache), ("warm", lambda: warm)):
+            def packing():
+                PopulationNetwork.create(genomes, config, cache())
+                return size
+
+            seconds, work = measure(packing, repeat)
+            results.append(result("compile." + case, {"networks": size}, work / seconds, "genomes/s", seconds))
+    return results
+
+
+def bench_generation(sizes, frames, rendered_frames, repeat):
+    """
+    wall time of a whole generation with eval_genomes, headless and
+    rendered (on SDL's dummy driver, without the frame rate cap)
+    """
+    results = []
+    for mode in ("headless", "rendered"):
+        budget = frames if mode == "headless" else rendered_frames
+        for size in sizes:
+            config = load_config(size)
+            genomes = make_genomes(config, size)
+
+            def generation():
+                return flappy_bird.eval_genomes(genomes, config, headless=mode == "headless", course=Course(1),
+                                                max_frames=budget, fps=None)
+
+            seconds, played = measure(generation, repeat)
+            results.append(result("generation." + mode, {"population": size, "max_frames": budget, "frames": played},
+                                  seconds, "s/generation", seconds))
+    return results
+
+
+def environment():
+    """
+    :return: dict describing the machine and the commit benchmarked
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "pygame": pygame.version.ver,
+        "neat": getattr(neat, "__version__", None),
+    }
+
+
+def key(entry):
+    return entry["name"], json.dumps(entry["params"], sort_keys=True)
+
+
+def print_results(results, baseline=None):
+    """
+    prints one line per result, with the change from a baseline run if given
+    :param results: list of result dicts
+    :param baseline: results of an earlier run, or None
+    :return: None
+    """
+    before = dict((key(entry), entry) for entry in baseline or [])
+    for entry in results:
+        params = " ".join("{0}={1}".format(k, v) for k, v in sorted(entry["params"].items()))
+        line = "{0:<22} {1:<40} {2:>14.6g} {3}".format(entry["name"], params, entry["value"], entry["unit"])
+        old = before.get(key(entry))
+        if old is not None and old["value"]:
+            # lower is better for times, higher for rates
+            ratio = entry["value"] / old["value"]
+            speedup = 1 / ratio if entry["unit"].startswith("s/") else ratio
+            line += "  {0:.2f}x".format(speedup)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the flappy bird simulation and training")
+    parser.add_argument("--quick", action="store_true",
+                        help="smaller budgets and a single run of each benchmark")
+    parser.add_argument("--only", default=None,
+                        help="comma separated groups to run: physics, collision, inference, compile, generation")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in POPULATION_SIZES),
+                        help="comma separated population sizes")
+    parser.add_argument("--output", default=None,
+                        help="save the results to this JSON file")
+    parser.add_argument("--compare", default=None,
+                        help="JSON file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    groups = args.only.split(",") if args.only else ["physics", "collision", "inference", "compile", "generation"]
+    repeat = 1 if args.quick else 3
+    scale = 0.2 if args.quick else 1
+
+    # the rendered benchmarks draw to a surface in memory, never a real window
+    flappy_bird.use_dummy_display()
+    flappy_bird.get_window()
+
+    results = []
+    if "physics" in groups:
+        results += bench_physics(sizes, int(2000 * scale), repeat)
+    if "collision" in groups:
+        results += bench_collision(int(20000 * scale), repeat)
+    if "inference" in groups:
+        results += bench_inference(sizes, int(200 * scale), repeat)
+    if "compile" in groups:
+        results += bench_compile(sizes, repeat)
+    if "generation" in groups:
+        results += bench_generation(sizes, int(1000 * scale), int(300 * scale), repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
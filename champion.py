@@ -0,0 +1,208 @@
+"""
+A small, neat free runtime for a trained bird.
+
+best.pickle held a pickled neat.nn.FeedForwardNetwork: loading it needs
+neat-python, unpickles arbitrary objects, and every decision walks its
+dicts. export_network flattens a feed forward network into a versioned
+binary file instead, and Champion loads that file and plays with nothing
+but the standard library.
+
+File layout, little endian:
+    header: magic "FBCH", version, inputs, outputs, nodes (uint16), links (uint32)
+    per node, in evaluation order: activation code (uint8), bias, response (float64), link count (uint16)
+    per link, grouped by node: source slot (uint16), weight (float64)
+    per output: value slot (uint16)
+Value slots are the inputs, then the nodes in evaluation order, then a slot
+that is always 0.0 for outputs no path reaches.
+"""
+import math
+import struct
+
+
+MAGIC = b"FBCH"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHI")
+
+
+def clamp(z, low, high):
+    return max(low, min(high, z))
+
+
+def inv_activation(z):
+    try:
+        return 1.0 / z
+    except ArithmeticError:  # same as neat, overflows give 0.0
+        return 0.0
+
+
+# the neat activation functions, same formulas. The position in this list is the
+# code saved in the file, so new ones only ever go at the end.
+ACTIVATIONS = [
+    ("sigmoid", lambda z: 1.0 / (1.0 + math.exp(-clamp(5.0 * z, -60.0, 60.0)))),
+    ("tanh", lambda z: math.tanh(clamp(2.5 * z, -60.0, 60.0))),
+    ("sin", lambda z: math.sin(clamp(5.0 * z, -60.0, 60.0))),
+    ("gauss", lambda z: math.exp(-5.0 * clamp(z, -3.4, 3.4) ** 2)),
+    ("relu", lambda z: z if z > 0.0 else 0.0),
+    ("softplus", lambda z: 0.2 * math.log(1 + math.exp(clamp(5.0 * z, -60.0, 60.0)))),
+    ("identity", lambda z: z),
+    ("clamped", lambda z: clamp(z, -1.0, 1.0)),
+    ("inv", inv_activation),
+    ("log", lambda z: math.log(max(1e-7, z))),
+    ("exp", lambda z: math.exp(clamp(z, -60.0, 60.0))),
+    ("abs", lambda z: abs(z)),
+    ("hat", lambda z: max(0.0, 1 - abs(z))),
+    ("square", lambda z: z ** 2),
+    ("cube", lambda z: z ** 3),
+]
+ACTIVATION_CODES = dict((name, code) for code, (name, function) in enumerate(ACTIVATIONS))
+
+
+class Champion:
+    """
+    a flattened feed forward network, evaluated exactly like
+    neat.nn.FeedForwardNetwork
+    """
+
+    def __init__(self, num_inputs, nodes, output_slots):
+        """
+        Initialize the network, see Champion.load
+        :param num_inputs: number of network inputs (int)
+        :param nodes: list of (activation code, bias, response, list of (source slot, weight)), in evaluation order
+        :param output_slots: value slot of every output (list of int)
+        :return: None
+        """
+        self.num_inputs = num_inputs
+        self.nodes = nodes
+        self.output_slots = output_slots
+
+        # everything activate needs, in the order it needs it
+        self.evals = [(num_inputs + i, ACTIVATIONS[code][1], bias, response, links)
+                      for i, (code, bias, response, links) in enumerate(nodes)]
+        self.values = [0.0] * (num_inputs + len(nodes) + 1)
+
+    def activate(self, inputs):
+        """
+        evaluates the network, same as FeedForwardNetwork.activate
+        :param inputs: list of num_inputs floats
+        :return: list of output values
+        """
+        if len(inputs) != self.num_inputs:
+            raise RuntimeError("Expected {0:n} inputs, got {1:n}".format(self.num_inputs, len(inputs)))
+
+        values = self.values
+        values[:self.num_inputs] = inputs
+        for slot, activation, bias, response, links in self.evals:
+            s = sum([values[i] * w for i, w in links])
+            values[slot] = activation(bias + response * s)
+        return [values[i] for i in self.output_slots]
+
+    def to_bytes(self):
+        """
+        :return: the network in the file format described at the top
+        """
+        links = [link for code, bias, response, node_links in self.nodes for link in node_links]
+        n, m = len(self.nodes), len(links)
+        return b"".join([
+            HEADER.pack(MAGIC, VERSION, self.num_inputs, len(self.output_slots), n, m),
+            struct.pack("<{0}B".format(n), *[code for code, bias, response, node_links in self.nodes]),
+            struct.pack("<{0}d".format(n), *[bias for code, bias, response, node_links in self.nodes]),
+            struct.pack("<{0}d".format(n), *[response for code, bias, response, node_links in self.nodes]),
+            struct.pack("<{0}H".format(n), *[len(node_links) for code, bias, response, node_links in self.nodes]),
+            struct.pack("<{0}H".format(m), *[source for source, weight in links]),
+            struct.pack("<{0}d".format(m), *[weight for source, weight in links]),
+            struct.pack("<{0}H".format(len(self.output_slots)), *self.output_slots),
+        ])
+
+    @staticmethod
+    def from_bytes(data):
+        """
+        reads a network written by to_bytes
+        :param data: bytes
+        :return: Champion
+        """
+        magic, version, num_inputs, num_outputs, n, m = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a champion file")
+        if version != VERSION:
+            raise ValueError("Unsupported champion file version {0}".format(version))
+
+        offset = HEADER.size
+        arrays = []
+        for fmt, length in (("B", n), ("d", n), ("d", n), ("H", n), ("H", m), ("d", m), ("H", num_outputs)):
+            layout = struct.Struct("<{0}{1}".format(length, fmt))
+            arrays.append(layout.unpack_from(data, offset))
+            offset += layout.size
+        codes, biases, responses, counts, sources, weights, output_slots = arrays
+
+        nodes = []
+        start = 0
+        for code, bias, response, length in zip(codes, biases, responses, counts):
+            nodes.append((code, bias, response, list(zip(sources[start:start + length], weights[start:start + length]))))
+            start += length
+        return Champion(num_inputs, nodes, list(output_slots))
+
+    @staticmethod
+    def load(filename):
+        """
+        :param filename: path of a champion file
+        :return: Champion
+        """
+        with open(filename, "rb") as f:
+            return Champion.from_bytes(f.read())
+
+    def save(self, filename):
+        """
+        :param filename: path to write the champion file to
+        :return: None
+        """
+        with open(filename, "wb") as f:
+            f.write(self.to_bytes())
+
+
+def from_network(net):
+    """
+    flattens a neat.nn.FeedForwardNetwork, keeping the order neat sums in so
+    the outputs are exactly the same
+    :param net: neat.nn.FeedForwardNetwork
+    :return: Champion
+    """
+    slots = dict((key, i) for i, key in enumerate(net.input_nodes))
+    for i, (node, activation, aggregation, bias, response, links) in enumerate(net.node_evals):
+        slots[node] = len(net.input_nodes) + i
+    zero_slot = len(net.input_nodes) + len(net.node_evals)
+
+    nodes = []
+    for node, activation, aggregation, bias, response, links in net.node_evals:
+        if aggregation.__name__ != "sum_aggregation":
+            raise ValueError("Champion only supports sum aggregation, got {0!r}".format(aggregation.__name__))
+        name = activation.__name__.replace("_activation", "")
+        if name not in ACTIVATION_CODES:
+            raise ValueError("Champion does not support the {0!r} activation".format(name))
+        nodes.append((ACTIVATION_CODES[name], bias, response, [(slots[i], w) for i, w in links]))
+
+    return Champion(len(net.input_nodes), nodes, [slots.get(key, zero_slot) for key in net.output_nodes])
+
+
+def export_network(net, filename):
+    """
+    writes a neat.nn.FeedForwardNetwork as a champion file
+    :param net: neat.nn.FeedForwardNetwork
+    :param filename: path of the champion file
+    :return: Champion
+    """
+    champion = from_network(net)
+    champion.save(filename)
+    return champion
+
+
+def export_genome(genome, config, filename):
+    """
+    writes the network of a genome as a champion file, needs neat
+    :param genome: neat genome
+    :param config: neat config
+    :param filename: path of the champion file
+    :return: Champion
+    """
+    from neat.nn import FeedForwardNetwork  # only exporting needs neat
+
+    return export_network(FeedForwardNetwork.create(genome, config), filename)
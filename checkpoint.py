@@ -0,0 +1,377 @@
+"""
+Checkpoints of a training run, to resume it after a crash.
+
+neat.Checkpointer pickles the whole population with gzip, which is slow and
+bulky for large populations, and it forgets the genome, node and species
+counters, so a restored run hands out keys that are already taken. Here the
+genes of every genome are packed into a few numpy columns instead, together
+with everything the next generation depends on: species, innovation
+counters, the random module's state and the course schedule. The columns are
+copied on the training thread and compressed and written on a background one.
+
+Evaluation is deterministic on a seeded course, so a run resumed from a
+checkpoint plays exactly the generations the original run would have.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from itertools import count
+
+import neat
+import numpy as np
+from neat.attributes import BoolAttribute, FloatAttribute
+
+from course import CourseSchedule
+
+
+FORMAT_VERSION = 1
+
+
+def next_count(counter):
+    """
+    reads the next value of an itertools.count without losing it
+    :param counter: itertools.count, or None
+    :return: (next value or None, equivalent count to use from now on)
+    """
+    if counter is None:
+        return None, None
+    value = next(counter)
+    return value, count(value)
+
+
+def pack_genes(genes, gene_type, strings):
+    """
+    packs the genes of every genome into columns, one row per gene
+    :param genes: list of (genome row, gene) tuples, in order
+    :param gene_type: neat gene class
+    :param strings: list of strings of the checkpoint, extended with new ones
+    :return: dict of column name to array
+    """
+    string_index = dict((s, i) for i, s in enumerate(strings))
+    columns = {"genome": np.array([row for row, gene in genes], dtype=np.int32)}
+    keys = [gene.key for row, gene in genes]
+    if keys and isinstance(keys[0], tuple):
+        columns["key"] = np.array(keys, dtype=np.int64).reshape(-1, 2)
+    else:
+        columns["key"] = np.array(keys, dtype=np.int64)
+
+    for attribute in gene_type._gene_attributes:
+        values = [getattr(gene, attribute.name) for row, gene in genes]
+        if isinstance(attribute, FloatAttribute):
+            columns[attribute.name] = np.array(values, dtype=np.float64)
+        elif isinstance(attribute, BoolAttribute):
+            columns[attribute.name] = np.array(values, dtype=bool)
+        else:
+            for value in values:
+                if value not in string_index:
+                    string_index[value] = len(strings)
+                    strings.append(value)
+            columns[attribute.name] = np.array([string_index[value] for value in values], dtype=np.int32)
+    return columns
+
+
+def unpack_genes(columns, gene_type, strings):
+    """
+    rebuilds the genes packed by pack_genes
+    :param columns: dict of column name to array
+    :param gene_type: neat gene class
+    :param strings: list of strings of the checkpoint
+    :return: list of (genome row, gene) tuples, in order
+    """
+    keys = columns["key"]
+    keys = [tuple(key) for key in keys.tolist()] if keys.ndim == 2 else keys.tolist()
+    values = {}
+    for attribute in gene_type._gene_attributes:
+        column = columns[attribute.name].tolist()
+        if not isinstance(attribute, (FloatAttribute, BoolAttribute)):
+            column = [strings[i] for i in column]
+        values[attribute.name] = column
+
+    genes = []
+    for i, (row, key) in enumerate(zip(columns["genome"].tolist(), keys)):
+        gene = gene_type(key)
+        for name, column in values.items():
+            setattr(gene, name, column[i])
+        genes.append((row, gene))
+    return genes
+
+
+def optional(value):
+    """ None as NaN, so optional floats fit in a float array """
+    return np.nan if value is None else value
+
+
+def from_optional(value):
+    return None if value != value else value
+
+
+class Checkpointer(neat.reporting.BaseReporter):
+    """
+    a reporter that saves a checkpoint at the end of a generation, every
+    generation_interval generations or time_interval_seconds, whichever
+    comes first
+    """
+
+    def __init__(self, population, directory, courses=None, generation_interval=5,
+                 time_interval_seconds=None, filename_prefix="checkpoint-"):
+        """
+        Initialize the checkpointer and add it to the population's reporters
+        :param population: neat.Population being trained
+        :param directory: directory the checkpoints are written to
+        :param courses: CourseSchedule of the run, saved with it if not None
+        :param generation_interval: generations between checkpoints, None for no limit (int)
+        :param time_interval_seconds: seconds between checkpoints, None for no limit (float)
+        :param filename_prefix: start of the file names, the generation number follows
+        :return: None
+        """
+        self.population = population
+        self.directory = directory
+        self.courses = courses
+        self.generation_interval = generation_interval
+        self.time_interval_seconds = time_interval_seconds
+        self.filename_prefix = filename_prefix
+
+        self.current_generation = None
+        self.last_generation_checkpoint = population.generation - 1
+        self.last_time_checkpoint = time.time()
+        self.writer = None
+
+        os.makedirs(directory, exist_ok=True)
+        population.add_reporter(self)
+
+    def start_generation(self, generation):
+        self.current_generation = generation
+
+    def end_generation(self, config, population, species_set):
+        due = False
+        if self.time_interval_seconds is not None:
+            due = time.time() - self.last_time_checkpoint >= self.time_interval_seconds
+        if not due and self.generation_interval is not None:
+            due = self.current_generation - self.last_generation_checkpoint >= self.generation_interval
+
+        if due:
+            # the population is already the next generation's
+            self.save(self.current_generation + 1)
+            self.last_generation_checkpoint = self.current_generation
+            self.last_time_checkpoint = time.time()
+
+    def filename(self, generation):
+        """
+        :param generation: generation number (int)
+        :return: path of the checkpoint of that generation
+        """
+        return os.path.join(self.directory, "{0}{1}.npz".format(self.filename_prefix, generation))
+
+    def save(self, generation):
+        """
+        snapshots the population now and writes it in the background, after
+        waiting for the previous checkpoint to finish writing
+        :param generation: generation number the saved population starts at (int)
+        :return: None
+        """
+        arrays = snapshot(self.population, generation, self.courses)
+        self.wait()
+        self.writer = threading.Thread(target=write_checkpoint, args=(self.filename(generation), arrays))
+        self.writer.start()
+
+    def wait(self):
+        """
+        waits until the last checkpoint is on disk
+        :return: None
+        """
+        if self.writer is not None:
+            self.writer.join()
+            self.writer = None
+
+
+def snapshot(population, generation, courses=None):
+    """
+    copies the state of a population into arrays, see restore_checkpoint
+    :param population: neat.Population
+    :param generation: generation number the population starts at (int)
+    :param courses: CourseSchedule, or None
+    :return: dict of name to numpy array
+    """
+    config = population.config
+    genome_config = config.genome_config
+    reproduction = population.reproduction
+    species_set = population.species
+
+    # the counters are read by taking their next value, so they are replaced
+    genome_key, reproduction.genome_indexer = next_count(reproduction.genome_indexer)
+    species_key, species_set.indexer = next_count(species_set.indexer)
+    node_key, genome_config.node_indexer = next_count(genome_config.node_indexer)
+
+    # genomes referenced from outside the population, like the best one so far, go last
+    genomes = list(population.population.values())
+    rows = dict((genome.key, row) for row, genome in enumerate(genomes))
+    others = [population.best_genome] + [s.representative for s in species_set.species.values()]
+    for genome in others:
+        if genome is not None and genome.key not in rows:
+            rows[genome.key] = len(genomes)
+            genomes.append(genome)
+
+    strings = []
+    nodes = pack_genes([(rows[g.key], gene) for g in genomes for gene in g.nodes.values()],
+                       genome_config.node_gene_type, strings)
+    connections = pack_genes([(rows[g.key], gene) for g in genomes for gene in g.connections.values()],
+                             genome_config.connection_gene_type, strings)
+
+    ancestors = np.full((len(genomes), 2), -1, dtype=np.int64)
+    for row, genome in enumerate(genomes):
+        parents = reproduction.ancestors.get(genome.key, ())
+        ancestors[row, :len(parents)] = parents
+
+    species = list(species_set.species.values())
+    members = [(i, rows[key]) for i, s in enumerate(species) for key in s.members]
+    history = [(i, value) for i, s in enumerate(species) for value in s.fitness_history]
+
+    version, state, gauss_next = random.getstate()
+    meta = {
+        "format": FORMAT_VERSION,
+        "generation": generation,
+        "population_size": len(population.population),
+        "best_genome": None if population.best_genome is None else rows[population.best_genome.key],
+        "genome_key": genome_key,
+        "species_key": species_key,
+        "node_key": node_key,
+        "strings": strings,
+        "random": [version, gauss_next],
+        "courses": None if courses is None else [courses.seed, courses.fresh, courses.generation, courses.episodes],
+    }
+
+    arrays = {
+        "meta": np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+        "random_state": np.array(state, dtype=np.uint32),
+        "genome_key": np.array([g.key for g in genomes], dtype=np.int64),
+        "genome_fitness": np.array([optional(g.fitness) for g in genomes], dtype=np.float64),
+        "ancestors": ancestors,
+        "species_key": np.array([s.key for s in species], dtype=np.int64),
+        "species_created": np.array([s.created for s in species], dtype=np.int64),
+        "species_last_improved": np.array([s.last_improved for s in species], dtype=np.int64),
+        "species_representative": np.array([rows[s.representative.key] for s in species], dtype=np.int64),
+        "species_fitness": np.array([optional(s.fitness) for s in species], dtype=np.float64),
+        "species_adjusted_fitness": np.array([optional(s.adjusted_fitness) for s in species], dtype=np.float64),
+        "members": np.array(members, dtype=np.int64).reshape(-1, 2),
+        "history_species": np.array([i for i, value in history], dtype=np.int64),
+        "history_fitness": np.array([value for i, value in history], dtype=np.float64),
+    }
+    for prefix, columns in (("node_", nodes), ("connection_", connections)):
+        for name, column in columns.items():
+            arrays[prefix + name] = column
+    return arrays
+
+
+def write_checkpoint(filename, arrays):
+    """
+    compresses the arrays to a file. The file is written under a temporary
+    name first, so a crash never leaves a half written checkpoint behind
+    :param filename: path of the checkpoint
+    :param arrays: dict of name to numpy array
+    :return: None
+    """
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(temporary, filename)
+
+
+def restore_checkpoint(filename, config):
+    """
+    rebuilds the population and course schedule saved in a checkpoint and
+    puts the random module back in the state it had
+    :param filename: path of the checkpoint
+    :param config: neat config of the run
+    :return: (neat.Population, CourseSchedule or None)
+    """
+    with np.load(filename) as data:
+        arrays = dict(data.items())
+    meta = json.loads(arrays["meta"].tobytes().decode("utf-8"))
+    if meta["format"] != FORMAT_VERSION:
+        raise ValueError("Unsupported checkpoint format {0!r} in {1}".format(meta["format"], filename))
+
+    genome_config = config.genome_config
+    strings = meta["strings"]
+
+    genomes = []
+    for key, fitness in zip(arrays["genome_key"].tolist(), arrays["genome_fitness"].tolist()):
+        genome = config.genome_type(key)
+        genome.fitness = from_optional(fitness)
+        genomes.append(genome)
+
+    for prefix, gene_type, field in (("node_", genome_config.node_gene_type, "nodes"),
+                                     ("connection_", genome_config.connection_gene_type, "connections")):
+        columns = dict((name[len(prefix):], array) for name, array in arrays.items() if name.startswith(prefix))
+        for row, gene in unpack_genes(columns, gene_type, strings):
+            getattr(genomes[row], field)[gene.key] = gene
+
+    population = dict((genome.key, genome) for genome in genomes[:meta["population_size"]])
+
+    species_set = config.species_set_type(config.species_set_config, None)
+    species = []
+    for key, created, last_improved, representative, fitness, adjusted_fitness in zip(
+            arrays["species_key"].tolist(), arrays["species_created"].tolist(),
+            arrays["species_last_improved"].tolist(), arrays["species_representative"].tolist(),
+            arrays["species_fitness"].tolist(), arrays["species_adjusted_fitness"].tolist()):
+        s = neat.species.Species(key, created)
+        s.last_improved = last_improved
+        s.representative = genomes[representative]
+        s.fitness = from_optional(fitness)
+        s.adjusted_fitness = from_optional(adjusted_fitness)
+        species.append(s)
+        species_set.species[key] = s
+    for i, row in arrays["members"].tolist():
+        species[i].members[genomes[row].key] = genomes[row]
+        species_set.genome_to_species[genomes[row].key] = species[i].key
+    for i, value in zip(arrays["history_species"].tolist(), arrays["history_fitness"].tolist()):
+        species[i].fitness_history.append(value)
+
+    p = neat.Population(config, (population, species_set, meta["generation"]))
+    species_set.reporters = p.reporters
+    if meta["best_genome"] is not None:
+        p.best_genome = genomes[meta["best_genome"]]
+
+    reproduction = p.reproduction
+    for genome, parents in zip(genomes, arrays["ancestors"].tolist()):
+        reproduction.ancestors[genome.key] = tuple(parent for parent in parents if parent >= 0)
+    if meta["genome_key"] is not None:
+        reproduction.genome_indexer = count(meta["genome_key"])
+    if meta["species_key"] is not None:
+        species_set.indexer = count(meta["species_key"])
+    genome_config.node_indexer = None if meta["node_key"] is None else count(meta["node_key"])
+
+    courses = None
+    if meta["courses"] is not None:
+        seed, fresh, generation = meta["courses"][:3]
+        # checkpoints from before several episodes per generation have no episodes
+        episodes = meta["courses"][3] if len(meta["courses"]) > 3 else 1
+        courses = CourseSchedule(seed, fresh=fresh, episodes=episodes)
+        courses.generation = generation
+
+    version, gauss_next = meta["random"]
+    random.setstate((version, tuple(arrays["random_state"].tolist()), gauss_next))
+    return p, courses
+
+
+def latest_checkpoint(directory, filename_prefix="checkpoint-"):
+    """
+    finds the checkpoint of the latest generation in a directory
+    :param directory: directory the checkpoints were written to
+    :param filename_prefix: start of the file names, see Checkpointer
+    :return: path of the checkpoint, or None if there is none
+    """
+    if not os.path.isdir(directory):
+        return None
+
+    pattern = re.compile(re.escape(filename_prefix) + r"(\d+)\.npz$")
+    generations = []
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            generations.append((int(match.group(1)), name))
+    if not generations:
+        return None
+    return os.path.join(directory, max(generations)[1])
@@ -0,0 +1,125 @@
+"""
+Seeded pipe courses.
+
+Pipe.set_height used to draw from the global random module, so two runs
+(or two worker processes) never flew the same pipes and fitness couldn't
+be compared. A Course pre-generates the pipe heights from a seed instead,
+and a CourseSchedule decides which course each generation flies. A
+schedule can also hand out several courses per generation, so every
+genome is scored on all of them and one lucky course can't carry it.
+"""
+import random
+
+import numpy as np
+
+
+class Course:
+    """
+    the sequence of pipe heights of one game, generated from a seed
+    """
+    MIN_HEIGHT = 50
+    MAX_HEIGHT = 450  # exclusive, like randrange
+
+    def __init__(self, seed, length=256):
+        """
+        Initialize the course
+        :param seed: seed of the pipe heights (int)
+        :param length: number of pipes to generate up front (int)
+        :return: None
+        """
+        self.seed = seed
+        self.heights = self.generate(seed, length)
+
+    @classmethod
+    def generate(cls, seed, length):
+        """
+        generates the first length pipe heights of the course. These are the
+        same heights random.seed(seed) followed by Pipe.set_height would give.
+        :param seed: seed of the pipe heights (int)
+        :param length: number of pipes (int)
+        :return: numpy int16 array
+        """
+        rng = random.Random(seed)
+        return np.array([rng.randrange(cls.MIN_HEIGHT, cls.MAX_HEIGHT) for _ in range(length)], dtype=np.int16)
+
+    def __len__(self):
+        return len(self.heights)
+
+    def height(self, index):
+        """
+        gets the height of a pipe, generating more of the course if needed
+        :param index: number of the pipe, 0 is the first one (int)
+        :return: int
+        """
+        if index >= len(self.heights):
+            # a longer course from the same seed starts with the same pipes
+            self.heights = self.generate(self.seed, max(index + 1, 2 * len(self.heights)))
+        return int(self.heights[index])
+
+    def __eq__(self, other):
+        return isinstance(other, Course) and self.seed == other.seed
+
+    def __hash__(self):
+        return hash(self.seed)
+
+    def __repr__(self):
+        return "Course(seed={0!r})".format(self.seed)
+
+
+class CourseSchedule:
+    """
+    picks the course of each generation: either the same course for the
+    whole run, or a fresh one every generation. Every genome of a
+    generation always flies that generation's course, or with episodes
+    above 1 that generation's list of courses.
+    """
+
+    def __init__(self, seed=None, fresh=True, episodes=1):
+        """
+        Initialize the schedule
+        :param seed: seed of the run, drawn from the random module if None (int)
+        :param fresh: new course every generation if True, otherwise always the same (bool)
+        :param episodes: number of courses every generation flies (int)
+        :return: None
+        """
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.fresh = fresh
+        self.episodes = episodes
+        self.generation = 0
+        self.fixed_course = None if fresh else self.courses(None)
+
+    def courses(self, generation):
+        """
+        generates the courses of a generation, the first one is the same
+        whatever the number of episodes
+        :param generation: generation number, None for the courses of a fixed schedule
+        :return: list of episodes Courses
+        """
+        courses = [Course(self.seed)] if generation is None else []
+        # string seeds are hashed the same way on every run and platform
+        while len(courses) < self.episodes:
+            key = [self.seed] if generation is None else [self.seed, generation]
+            if courses:
+                key.append(len(courses))
+            courses.append(Course(random.Random(":".join(str(k) for k in key)).getrandbits(32)))
+        return courses
+
+    def course(self, generation):
+        """
+        gets the course of a generation
+        :param generation: generation number, starting at 0 (int)
+        :return: Course, or list of Courses with several episodes
+        """
+        courses = self.fixed_course if not self.fresh else self.courses(generation)
+        return courses[0] if self.episodes == 1 else courses
+
+    def next(self):
+        """
+        gets the course of the next generation
+        :return: Course, or list of Courses with several episodes
+        """
+        course = self.course(self.generation)
+        self.generation += 1
+        return course
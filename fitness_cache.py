@@ -0,0 +1,126 @@
+"""
+Fitness of genomes that were already played.
+
+Elites are carried into the next generation unchanged, and a converged
+population breeds many identical children. On the same course such a
+genome flies exactly the same game again, so a bird that died before the
+game ended would earn exactly the same fitness. FitnessCache remembers
+that fitness under a hash of the genome's network and the course seeds,
+and eval_genomes only plays the genomes it doesn't know.
+
+Only fitness that would come out the same is cached: that of birds that
+died, and of birds still flying when the frame or score budget ran out,
+which always happens at the same frame of a course. A bird still flying
+when the game stopped for any other reason, like the wall time budget,
+could have flown on. A cache belongs to one run, the budgets and aggregate
+of the run must not change while it is used.
+"""
+import hashlib
+from collections import OrderedDict
+
+
+def genome_hash(genome):
+    """
+    hashes everything that makes up a genome's network: the nodes with
+    their biases, responses and functions, and the enabled connections with
+    their weights. Genomes with the same hash play the same way.
+    :param genome: neat genome
+    :return: bytes
+    """
+    nodes = sorted((key, node.bias, node.response, node.activation, node.aggregation)
+                   for key, node in genome.nodes.items())
+    connections = sorted((key, connection.weight)
+                         for key, connection in genome.connections.items() if connection.enabled)
+    # repr round trips floats exactly
+    return hashlib.blake2b(repr((nodes, connections)).encode("ascii"), digest_size=16).digest()
+
+
+def course_seeds(course):
+    """
+    :param course: Course, or list of Courses
+    :return: tuple of the seeds
+    """
+    return tuple(c.seed for c in course) if isinstance(course, list) else (course.seed,)
+
+
+class FitnessCache:
+    """
+    a bounded map from (genome hash, course seeds) to fitness, forgetting
+    the least recently used entries first
+    """
+
+    def __init__(self, max_size=10000):
+        """
+        Initialize the cache
+        :param max_size: number of fitness values to keep at most (int)
+        :return: None
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        :param key: (genome hash, course seeds)
+        :return: the cached fitness, None if there's none
+        """
+        fitness = self.entries.get(key)
+        if fitness is not None:
+            self.entries.move_to_end(key)
+        return fitness
+
+    def put(self, key, fitness):
+        """
+        :param key: (genome hash, course seeds)
+        :param fitness: float
+        :return: None
+        """
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def update(self, other):
+        """
+        adds the entries of another cache, like the one a worker process filled
+        :param other: FitnessCache
+        :return: None
+        """
+        for key, fitness in other.entries.items():
+            self.put(key, fitness)
+
+    def lookup(self, genomes, course):
+        """
+        sets the fitness of every genome the cache knows
+        :param genomes: list of (genome_id, genome) tuples
+        :param course: Course, or list of Courses, the genomes fly
+        :return: list of the (genome_id, genome) tuples left to play
+        """
+        seeds = course_seeds(course)
+        misses = []
+        for genome_id, genome in genomes:
+            fitness = self.get((genome_hash(genome), seeds))
+            if fitness is None:
+                misses.append((genome_id, genome))
+            else:
+                genome.fitness = fitness
+        self.hits += len(genomes) - len(misses)
+        self.misses += len(misses)
+        return misses
+
+    def store(self, genomes, course, finished):
+        """
+        remembers the fitness of the genomes whose game was finished
+        :param genomes: list of (genome_id, genome) tuples, with their fitness set
+        :param course: Course, or list of Courses, the genomes flew
+        :param finished: for each genome, whether its fitness is final (list of bool)
+        :return: None
+        """
+        seeds = course_seeds(course)
+        for (genome_id, genome), done in zip(genomes, finished):
+            if done:
+                self.put((genome_hash(genome), seeds), genome.fitness)
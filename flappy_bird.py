@@ -7,39 +7,143 @@ Author: Tech With Tim
 Estimated Work Time: 5 hours (1 just for that damn collision)
 """
 import pygame
+import numpy as np
 import random
 import os
+import argparse
+import functools
 import time
 import neat
-import visualize
+from population_net import PopulationNetwork
+from parallel import ParallelEvaluator
+from course import Course, CourseSchedule
+from checkpoint import Checkpointer, latest_checkpoint, restore_checkpoint
+from champion import export_genome
+from replay import Recording
+from timing import NO_TIMER, PhaseTimer, TimingReporter
+from islands import run_islands
+from fitness_cache import FitnessCache
+from metrics import MetricsReporter
+from plotting import PlotService, PlotReporter
 import pickle
-pygame.font.init()  # init font
 
 WIN_WIDTH = 600
 WIN_HEIGHT = 800
 FLOOR = 730
-STAT_FONT = pygame.font.SysFont("comicsans", 50)
-END_FONT = pygame.font.SysFont("comicsans", 70)
 DRAW_LINES = False
+IMG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imgs")
+
+# The window, images and fonts are only created when they are first needed
+# (get_window, load_assets, load_fonts), so importing this file is quick and
+# headless training and worker processes never touch the display.
+WIN = None
+STAT_FONT = None
+END_FONT = None
+pipe_img = None
+bg_img = None
+bird_images = None
+base_img = None
+assets_converted = None  # None: not loaded, False: loaded without a window, True: converted for the window
 
-WIN = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
-pygame.display.set_caption("Flappy Bird")
+gen = 0
 
-pipe_img = pygame.transform.scale2x(pygame.image.load(os.path.join("imgs","pipe.png")).convert_alpha())
-bg_img = pygame.transform.scale(pygame.image.load(os.path.join("imgs","bg.png")).convert_alpha(), (600, 900))
-bird_images = [pygame.transform.scale2x(pygame.image.load(os.path.join("imgs","bird" + str(x) + ".png"))) for x in range(1,4)]
-base_img = pygame.transform.scale2x(pygame.image.load(os.path.join("imgs","base.png")).convert_alpha())
+# simulation steps per drawn frame while watching, None to simulate as
+# fast as possible and draw 30 times a second. Switched with the 1-4 keys
+# and kept from one generation to the next.
+SPEED_KEYS = {pygame.K_1: 1, pygame.K_2: 4, pygame.K_3: 16, pygame.K_4: None}
+speed = 1
 
-gen = 0
+# labels of the network inputs and output in drawings of a network
+NODE_NAMES = {-1: "bird y", -2: "top pipe", -3: "bottom pipe", 0: "jump"}
+
+
+def get_window():
+    """
+    opens the game window the first time it's needed
+    :return: pygame window surface
+    """
+    global WIN
+    if WIN is None:
+        WIN = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
+        pygame.display.set_caption("Flappy Bird")
+        load_assets()
+    return WIN
+
+
+def load_fonts():
+    """
+    loads the fonts the first time they are needed, SysFont scans
+    every font on the system which is slow
+    :return: None
+    """
+    global STAT_FONT, END_FONT
+    if STAT_FONT is None:
+        pygame.font.init()  # init font
+        STAT_FONT = pygame.font.SysFont("comicsans", 50)
+        END_FONT = pygame.font.SysFont("comicsans", 70)
+
+
+def load_assets():
+    """
+    loads and scales the images the first time they are needed. With a
+    window open they are converted to its pixel format for fast blits,
+    without one (headless) they are used as loaded, which gives the same
+    collision masks. Images loaded before the window was opened are
+    loaded again, converted.
+    :return: None
+    """
+    global pipe_img, bg_img, bird_images, base_img, assets_converted
+    convert = pygame.display.get_init() and pygame.display.get_surface() is not None
+    if assets_converted is not None and (assets_converted or not convert):
+        return
+
+    def load(name):
+        img = pygame.image.load(os.path.join(IMG_DIR, name))
+        return img.convert_alpha() if convert else img
+
+    pipe_img = pygame.transform.scale2x(load("pipe.png"))
+    bg_img = pygame.transform.scale(load("bg.png"), (600, 900))
+    bird_images = [pygame.transform.scale2x(pygame.image.load(os.path.join(IMG_DIR, "bird" + str(x) + ".png"))) for x in range(1,4)]
+    base_img = pygame.transform.scale2x(load("base.png"))
+    assets_converted = convert
+
+    Bird.set_images(bird_images)
+    Pipe.set_image(pipe_img)
+    Base.set_image(base_img)
+
+    rotated_sprites.clear()
+    if convert:
+        # pre-rotate every (animation frame, tilt) a bird can show, drawing is then just a blit
+        for img in Bird.IMGS:
+            for angle in Bird.tilts():
+                rotated_sprite(img, angle)
 
 class Bird:
     """
     Bird class representing the flappy bird
     """
+    __slots__ = ("x", "y", "tilt", "tick_count", "vel", "height", "img_count", "img")
     MAX_ROTATION = 25
-    IMGS = bird_images
+    IMGS = None  # set by load_assets
     ROT_VEL = 20
     ANIMATION_TIME = 5
+    MASKS = None
+    WIDTH = None
+    HEIGHT = None
+    IMG_HEIGHTS = None
+
+    @classmethod
+    def set_images(cls, images):
+        """
+        set the animation images, and build one collision mask per image
+        :param images: list of pygame surfaces
+        :return: None
+        """
+        cls.IMGS = images
+        cls.MASKS = {img: pygame.mask.from_surface(img) for img in images}
+        cls.WIDTH = max(img.get_width() for img in images)
+        cls.HEIGHT = max(img.get_height() for img in images)
+        cls.IMG_HEIGHTS = np.array([img.get_height() for img in images])
 
     def __init__(self, x, y):
         """
@@ -48,6 +152,7 @@ class Bird:
         :param y: starting y pos (int)
         :return: None
         """
+        load_assets()
         self.x = x
         self.y = y
         self.tilt = 0  # degrees to tilt
@@ -92,10 +197,9 @@ class Bird:
             if self.tilt > -90:
                 self.tilt -= self.ROT_VEL
 
-    def draw(self, win):
+    def animate(self):
         """
-        draw the bird
-        :param win: pygame window or surface
+        advance the flapping animation and pick the image for this frame
         :return: None
         """
         self.img_count += 1
@@ -118,32 +222,324 @@ class Bird:
             self.img = self.IMGS[1]
             self.img_count = self.ANIMATION_TIME*2
 
+    def draw(self, win):
+        """
+        draw the bird
+        :param win: pygame window or surface
+        :return: None
+        """
+        self.animate()
+        self.blit(win)
 
+    def blit(self, win):
+        """
+        draw the bird with its current image, without animating it
+        :param win: pygame window or surface
+        :return: None
+        """
         # tilt the bird
         blitRotateCenter(win, self.img, (self.x, self.y), self.tilt)
 
+    @classmethod
+    def tilts(cls):
+        """
+        every tilt a bird can have: tilting up always snaps to MAX_ROTATION,
+        tilting down goes ROT_VEL at a time from there (or from 0) to -90
+        :return: sorted list of angles
+        """
+        tilts = set()
+        pending = [0, cls.MAX_ROTATION]
+        while pending:
+            tilt = pending.pop()
+            if tilt not in tilts:
+                tilts.add(tilt)
+                if tilt > -90:
+                    pending.append(tilt - cls.ROT_VEL)
+        return sorted(tilts)
+
     def get_mask(self):
         """
         gets the mask for the current image of the bird
+        :return: pygame.mask.Mask
+        """
+        mask = self.MASKS.get(self.img)
+        if mask is None:  # not one of the animation frames, cache it too
+            mask = self.MASKS[self.img] = pygame.mask.from_surface(self.img)
+        return mask
+
+
+class BirdPopulation:
+    """
+    physics and animation state of a whole population of birds held
+    in preallocated numpy arrays, so every bird is moved with one
+    batched step instead of one Bird.move call per bird. Birds are
+    never removed, dying just clears their alive flag, and fitness
+    is kept per slot.
+    """
+    MAX_ROTATION = Bird.MAX_ROTATION
+    ROT_VEL = Bird.ROT_VEL
+    ANIMATION_TIME = Bird.ANIMATION_TIME
+    ARRAYS = ("y", "tilt", "tick_count", "vel", "height", "img_count", "img_index", "alive", "fitness")
+    FLAP_IMAGES = np.array([0] + [0]*ANIMATION_TIME + [1]*ANIMATION_TIME + [2]*ANIMATION_TIME
+                           + [1]*ANIMATION_TIME + [0], dtype=np.int8)
+
+    def __init__(self, size, x, y):
+        """
+        Initialize every bird at the same starting position
+        :param size: number of birds (int)
+        :param x: starting x pos shared by all birds (int)
+        :param y: starting y pos (int)
         :return: None
         """
-        return pygame.mask.from_surface(self.img)
+        load_assets()
+        self.x = x
+        self.y = np.full(size, y, dtype=np.float64)
+        self.tilt = np.zeros(size, dtype=np.int16)
+        self.tick_count = np.zeros(size, dtype=np.int64)
+        self.vel = np.zeros(size, dtype=np.float64)
+        self.height = self.y.copy()
+        self.img_count = np.zeros(size, dtype=np.int8)
+        self.img_index = np.zeros(size, dtype=np.int8)  # index in Bird.IMGS
+        self.alive = np.ones(size, dtype=bool)
+        self.fitness = np.zeros(size, dtype=np.float64)
+
+        # scratch space of move, so a frame doesn't allocate its temporaries
+        self.displacement = np.empty(size, dtype=np.float64)
+        self.scratch = np.empty(size, dtype=np.float64)
+        self.tilt_up = np.empty(size, dtype=bool)
+        self.tilt_down = np.empty(size, dtype=bool)
+
+    def clone(self):
+        """
+        copies the whole state, changing the copy leaves this one alone
+        :return: BirdPopulation
+        """
+        population = BirdPopulation.__new__(BirdPopulation)
+        population.x = self.x
+        for name in self.ARRAYS:
+            setattr(population, name, getattr(self, name).copy())
+        population.displacement = np.empty_like(self.displacement)
+        population.scratch = np.empty_like(self.scratch)
+        population.tilt_up = np.empty_like(self.tilt_up)
+        population.tilt_down = np.empty_like(self.tilt_down)
+        return population
+
+    def __len__(self):
+        return len(self.y)
+
+    def alive_indices(self):
+        """
+        gets the slots of the birds still alive
+        :return: numpy int array
+        """
+        return np.flatnonzero(self.alive)
+
+    def best(self, k, block=None):
+        """
+        gets the slots of the k live birds with the highest fitness. Ties
+        (birds that flew the same frames and pipes) keep population order.
+        :param k: number of birds, all live birds if None (int)
+        :param block: slice of the slots to pick from, all of them if None
+        :return: numpy int array
+        """
+        alive = self.alive_indices()
+        if block is not None:
+            alive = alive[(alive >= block.start) & (alive < block.stop)]
+        if k is None or len(alive) <= k:
+            return alive
+        order = np.argsort(-self.fitness[alive], kind="stable")[:k]
+        return alive[np.sort(order)]
+
+    def kill(self, index):
+        """
+        removes a bird from the game
+        :param index: slot of the bird (int)
+        :return: None
+        """
+        self.alive[index] = False
+
+    def outside_gap(self, pipe, block=None):
+        """
+        broad phase for collisions: slots of the live birds that are not
+        entirely inside the gap of the pipe, only those can touch it
+        :param pipe: Pipe object
+        :param block: slice of the slots flying this pipe, all of them if None
+        :return: numpy int array
+        """
+        if block is None:
+            block = slice(0, len(self.y))
+        y = np.round(self.y[block])  # rounds half to even, like round()
+        return block.start + np.flatnonzero(self.alive[block] & ((y < pipe.height) | (y + Bird.HEIGHT > pipe.bottom)))
+
+    def jump(self, mask):
+        """
+        make the selected birds jump, same as Bird.jump
+        :param mask: boolean numpy array, True for birds that jump, or array of slots
+        :return: None
+        """
+        self.vel[mask] = -10.5
+        self.tick_count[mask] = 0
+        self.height[mask] = self.y[mask]
+
+    def move(self):
+        """
+        move every bird one frame, same as Bird.move. Dead birds keep
+        falling too, it's cheaper than masking them out and nobody reads them.
+        :return: None
+        """
+        self.tick_count += 1
+
+        # for downward acceleration, vel*t + 0.5*3*t**2 computed in place
+        displacement = self.displacement
+        np.multiply(self.vel, self.tick_count, out=displacement)
+        np.square(self.tick_count, out=self.scratch)
+        self.scratch *= 0.5*(3)
+        displacement += self.scratch
+
+        # terminal velocity
+        np.minimum(displacement, 16, out=displacement)
+        tilt_up, tilt_down = self.tilt_up, self.tilt_down
+        np.less(displacement, 0, out=tilt_up)
+        np.subtract(displacement, 2, out=displacement, where=tilt_up)
+
+        self.y += displacement
+
+        # tilt up while moving up or still above the jump, else nose dive down to -90
+        np.add(self.height, 50, out=self.scratch)
+        np.less(self.y, self.scratch, out=tilt_down)
+        np.logical_or(tilt_up, tilt_down, out=tilt_up)
+        np.logical_not(tilt_up, out=tilt_down)
+        np.greater(self.tilt, -90, out=tilt_down, where=tilt_down)
+        np.maximum(self.tilt, self.MAX_ROTATION, out=self.tilt, where=tilt_up)
+        np.subtract(self.tilt, self.ROT_VEL, out=self.tilt, where=tilt_down)
+
+    def animate(self):
+        """
+        advance the flapping animation of every bird, same as Bird.animate.
+        Dead birds keep flapping too, like they keep falling.
+        :return: None
+        """
+        t = self.ANIMATION_TIME
+        count = self.img_count
+        count += 1
+
+        # For animation of bird, loop through three images: the image of
+        # every count, the last one starts the loop again
+        np.take(self.FLAP_IMAGES, count, out=self.img_index)
+        count[count == t*4 + 1] = 0
+
+        # so when bird is nose diving it isn't flapping
+        diving = self.tilt <= -80
+        self.img_index[diving] = 1
+        count[diving] = t*2
+
+    def bird(self, index):
+        """
+        gets a Bird that reads and writes its physics from this population
+        :param index: slot of the bird in the arrays (int)
+        :return: PopulationBird
+        """
+        return PopulationBird(self, index)
+
+
+def population_field(name):
+    """
+    property that reads and writes a PopulationBird's slot in one
+    of its population's arrays
+    :param name: name of the BirdPopulation array (str)
+    :return: property
+    """
+    def get(self):
+        return getattr(self.population, name)[self.index]
+
+    def set(self, value):
+        getattr(self.population, name)[self.index] = value
+
+    return property(get, set)
+
+
+class PopulationBird(Bird):
+    """
+    a Bird whose whole state lives in a BirdPopulation, so it can be
+    drawn and collided like any other bird (and still move on its own).
+    It holds nothing but its slot, so views are made when needed.
+    """
+    __slots__ = ("population", "index")
+    y = population_field("y")
+    tilt = population_field("tilt")
+    tick_count = population_field("tick_count")
+    vel = population_field("vel")
+    height = population_field("height")
+    img_count = population_field("img_count")
+
+    def __init__(self, population, index):
+        """
+        Initialize the view
+        :param population: BirdPopulation holding the bird's state
+        :param index: slot of this bird in the population arrays (int)
+        :return: None
+        """
+        self.population = population
+        self.index = index
+
+    @property
+    def x(self):
+        return self.population.x
+
+    @property
+    def img(self):
+        return self.IMGS[self.population.img_index[self.index]]
+
+    @img.setter
+    def img(self, img):
+        self.population.img_index[self.index] = self.IMGS.index(img)
+
+    def blit(self, win):
+        """
+        draw the bird, reading the population arrays directly
+        :param win: pygame window or surface
+        :return: None
+        """
+        population, index = self.population, self.index
+        blitRotateCenter(win, self.IMGS[population.img_index[index]], (population.x, population.y[index]),
+                         population.tilt[index])
 
 
 class Pipe():
     """
     represents a pipe object
     """
+    __slots__ = ("x", "height", "top", "bottom", "passed")
     GAP = 200
     VEL = 5
+    WIDTH = None  # set by load_assets
+    PIPE_TOP = None
+    PIPE_BOTTOM = None
+    TOP_MASK = None
+    BOTTOM_MASK = None
+
+    @classmethod
+    def set_image(cls, image):
+        """
+        set the pipe image. It never changes, so every pipe shares it and
+        the flipped top image and both masks are built here once
+        :param image: pygame surface of the bottom pipe
+        :return: None
+        """
+        cls.WIDTH = image.get_width()
+        cls.PIPE_TOP = pygame.transform.flip(image, False, True)
+        cls.PIPE_BOTTOM = image
+        cls.TOP_MASK = pygame.mask.from_surface(cls.PIPE_TOP)
+        cls.BOTTOM_MASK = pygame.mask.from_surface(cls.PIPE_BOTTOM)
 
-    def __init__(self, x):
+    def __init__(self, x, height=None):
         """
         initialize pipe object
         :param x: int
-        :param y: int
+        :param height: int, random if None
         :return" None
         """
+        load_assets()
         self.x = x
         self.height = 0
 
@@ -151,19 +547,27 @@ class Pipe():
         self.top = 0
         self.bottom = 0
 
-        self.PIPE_TOP = pygame.transform.flip(pipe_img, False, True)
-        self.PIPE_BOTTOM = pipe_img
-
         self.passed = False
 
-        self.set_height()
+        self.set_height(height)
+
+    def clone(self):
+        """
+        :return: a copy of the pipe
+        """
+        pipe = Pipe.__new__(Pipe)
+        pipe.x, pipe.height, pipe.top, pipe.bottom, pipe.passed = self.x, self.height, self.top, self.bottom, self.passed
+        return pipe
 
-    def set_height(self):
+    def set_height(self, height=None):
         """
         set the height of the pipe, from the top of the screen
+        :param height: int, random if None
         :return: None
         """
-        self.height = random.randrange(50, 450)
+        if height is None:
+            height = random.randrange(Course.MIN_HEIGHT, Course.MAX_HEIGHT)
+        self.height = height
         self.top = self.height - self.PIPE_TOP.get_height()
         self.bottom = self.height + self.GAP
 
@@ -186,6 +590,16 @@ class Pipe():
         win.blit(self.PIPE_BOTTOM, (self.x, self.bottom))
 
 
+    def overlaps_column(self, x, width):
+        """
+        broad phase for collisions: only a pipe that horizontally
+        overlaps the columns x to x+width can touch a bird there
+        :param x: left edge of the column (int)
+        :param width: width of the column (int)
+        :return: Bool
+        """
+        return self.x < x + width and self.x + self.WIDTH > x
+
     def collide(self, bird, win):
         """
         returns if a point is colliding with the pipe
@@ -193,13 +607,17 @@ class Pipe():
         :return: Bool
         """
         bird_mask = bird.get_mask()
-        top_mask = pygame.mask.from_surface(self.PIPE_TOP)
-        bottom_mask = pygame.mask.from_surface(self.PIPE_BOTTOM)
-        top_offset = (self.x - bird.x, self.top - round(bird.y))
-        bottom_offset = (self.x - bird.x, self.bottom - round(bird.y))
+        bird_y = round(bird.y)
 
-        b_point = bird_mask.overlap(bottom_mask, bottom_offset)
-        t_point = bird_mask.overlap(top_mask,top_offset)
+        # a bird completely inside the gap can't touch either pipe
+        if bird_y >= self.height and bird_y + bird_mask.get_size()[1] <= self.bottom:
+            return False
+
+        top_offset = (self.x - bird.x, self.top - bird_y)
+        bottom_offset = (self.x - bird.x, self.bottom - bird_y)
+
+        b_point = bird_mask.overlap(self.BOTTOM_MASK, bottom_offset)
+        t_point = bird_mask.overlap(self.TOP_MASK, top_offset)
 
         if b_point or t_point:
             return True
@@ -210,9 +628,20 @@ class Base:
     """
     Represnts the moving floor of the game
     """
+    __slots__ = ("y", "x1", "x2")
     VEL = 5
-    WIDTH = base_img.get_width()
-    IMG = base_img
+    WIDTH = None  # set by load_assets
+    IMG = None
+
+    @classmethod
+    def set_image(cls, image):
+        """
+        set the floor image
+        :param image: pygame surface
+        :return: None
+        """
+        cls.WIDTH = image.get_width()
+        cls.IMG = image
 
     def __init__(self, y):
         """
@@ -220,10 +649,19 @@ class Base:
         :param y: int
         :return: None
         """
+        load_assets()
         self.y = y
         self.x1 = 0
         self.x2 = self.WIDTH
 
+    def clone(self):
+        """
+        :return: a copy of the floor
+        """
+        base = Base.__new__(Base)
+        base.y, base.x1, base.x2 = self.y, self.x1, self.x2
+        return base
+
     def move(self):
         """
         move floor so it looks like its scrolling
@@ -247,6 +685,84 @@ class Base:
         win.blit(self.IMG, (self.x2, self.y))
 
 
+class HUD:
+    """
+    the score, generation and alive labels. Rendering text is slow and
+    their values rarely change, so each label is only rendered again
+    when its value does.
+    """
+    COLOR = (255,255,255)
+
+    def __init__(self, font):
+        """
+        Initialize the object
+        :param font: pygame font of the labels
+        :return: None
+        """
+        self.font = font
+        self.labels = {}
+
+    def label(self, name, value):
+        """
+        gets the rendered "name: value" label
+        :param name: name of the label (str)
+        :param value: value shown after the name
+        :return: pygame surface
+        """
+        cached = self.labels.get(name)
+        if cached is None or cached[0] != value:
+            cached = self.labels[name] = (value, self.font.render(name + ": " + str(value), 1, self.COLOR))
+        return cached[1]
+
+    def draw(self, win, score, gen, alive, speed=1):
+        """
+        draw the labels, in the same places as always
+        :param win: pygame window or surface
+        :param score: score of the game (int)
+        :param gen: generation shown (int)
+        :param alive: number of birds alive (int)
+        :param speed: simulation steps per drawn frame, None for unbounded, only shown if not 1
+        :return: None
+        """
+        # score
+        score_label = self.label("Score", score)
+        win.blit(score_label, (WIN_WIDTH - score_label.get_width() - 15, 10))
+
+        # generations
+        win.blit(self.label("Gens", gen), (10, 10))
+
+        # alive
+        win.blit(self.label("Alive", alive), (10, 50))
+
+        # fast forward
+        if speed != 1:
+            win.blit(self.label("Speed", "max" if speed is None else "{0}x".format(speed)), (10, 90))
+
+
+hud = None  # created by draw_window, with the fonts
+
+
+# rotated copies of images, keyed by (image, angle), see rotated_sprite
+rotated_sprites = {}
+
+
+def rotated_sprite(image, angle):
+    """
+    Rotate a surface around its center, only the first time it's
+    asked for at that angle
+    :param image: the image surface to rotate
+    :param angle: a float value for angle
+    :return: (rotated surface, offset of its top left from the image's top left)
+    """
+    key = (image, angle)
+    sprite = rotated_sprites.get(key)
+    if sprite is None:
+        rotated_image = pygame.transform.rotate(image, angle)
+        new_rect = rotated_image.get_rect(center = image.get_rect().center)
+        sprite = rotated_sprites[key] = (rotated_image, new_rect.topleft)
+    return sprite
+
+
 def blitRotateCenter(surf, image, topleft, angle):
     """
     Rotate a surface and blit it to the window
@@ -256,22 +772,30 @@ def blitRotateCenter(surf, image, topleft, angle):
     :param angle: a float value for angle
     :return: None
     """
-    rotated_image = pygame.transform.rotate(image, angle)
-    new_rect = rotated_image.get_rect(center = image.get_rect(topleft = topleft).center)
+    rotated_image, (dx, dy) = rotated_sprite(image, angle)
+    x, y = image.get_rect(topleft = topleft).topleft  # rounded the same way as before
 
-    surf.blit(rotated_image, new_rect.topleft)
+    surf.blit(rotated_image, (x + dx, y + dy))
 
-def draw_window(win, birds, pipes, base, score, gen, pipe_ind):
+def draw_window(win, birds, pipes, base, score, gen, pipe_ind, alive=None, speed=1):
     """
-    draws the windows for the main game loop
+    draws the windows for the main game loop. The birds are drawn as
+    they are, animating them is up to the game loop.
     :param win: pygame window surface
     :param bird: a Bird object
     :param pipes: List of pipes
     :param score: score of the game (int)
     :param gen: current generation
     :param pipe_ind: index of closest pipe
+    :param alive: number of birds alive, len(birds) if None (int)
+    :param speed: simulation steps per drawn frame, shown when it isn't 1
     :return: None
     """
+    global hud
+    if hud is None:
+        load_fonts()
+        hud = HUD(STAT_FONT)
+
     if gen == 0:
         gen = 1
     win.blit(bg_img, (0,0))
@@ -289,148 +813,711 @@ def draw_window(win, birds, pipes, base, score, gen, pipe_ind):
             except:
                 pass
         # draw bird
-        bird.draw(win)
+        bird.blit(win)
 
-    # score
-    score_label = STAT_FONT.render("Score: " + str(score),1,(255,255,255))
-    win.blit(score_label, (WIN_WIDTH - score_label.get_width() - 15, 10))
+    if alive is None:
+        alive = len(birds)
+    hud.draw(win, score, gen-1, alive, speed)
 
-    # generations
-    score_label = STAT_FONT.render("Gens: " + str(gen-1),1,(255,255,255))
-    win.blit(score_label, (10, 10))
+    pygame.display.update()
 
-    # alive
-    score_label = STAT_FONT.render("Alive: " + str(len(birds)),1,(255,255,255))
-    win.blit(score_label, (10, 50))
 
-    pygame.display.update()
+def use_dummy_display():
+    """
+    switches to SDL's dummy video driver so training boxes without a
+    screen never open (or need) a real window, closing it if it's open
+    :return: None
+    """
+    global WIN
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    if WIN is not None:
+        pygame.display.quit()
+        WIN = None
 
 
-def eval_genomes(genomes, config):
+def check_aggregate(aggregate):
     """
-    runs the simulation of the current population of
-    birds and sets their fitness based on the distance they
-    reach in the game.
+    makes sure aggregate_fitness can combine the episodes with aggregate,
+    before a whole generation is played for nothing
+    :param aggregate: "mean", "min", or a quantile between 0 and 1 (float)
+    :return: aggregate, a quantile as a float
     """
-    global WIN, gen
-    win = WIN
-    gen += 1
+    if aggregate in ("mean", "min"):
+        return aggregate
+    if not isinstance(aggregate, str):
+        try:
+            quantile = float(aggregate)
+        except (TypeError, ValueError):
+            pass
+        else:
+            if 0 <= quantile <= 1:
+                return quantile
+    raise ValueError("aggregate must be \"mean\", \"min\" or a quantile between 0 and 1, "
+                     "got {0!r}".format(aggregate))
+
+
+def parse_aggregate(text):
+    """
+    argparse type of --aggregate
+    :param text: "mean", "min", or a quantile between 0 and 1
+    :return: "mean", "min", or the quantile (float)
+    """
+    try:
+        return check_aggregate(text if text in ("mean", "min") else float(text))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected mean, min or a quantile between 0 and 1, "
+                                         "got {0!r}".format(text))
 
-    # start by creating lists holding the genome itself, the
-    # neural network associated with the genome and the
-    # bird object that uses that network to play
-    nets = []
-    birds = []
-    ge = []
-    for genome_id, genome in genomes:
-        genome.fitness = 0  # start with fitness level of 0
-        net = neat.nn.FeedForwardNetwork.create(genome, config)
-        nets.append(net)
-        birds.append(Bird(230,350))
-        ge.append(genome)
-
-    base = Base(FLOOR)
-    pipes = [Pipe(700)]
-    score = 0
 
-    clock = pygame.time.Clock()
+def aggregate_fitness(episodes, aggregate="mean"):
+    """
+    combines the fitness of every genome on several courses
+    :param episodes: (courses, genomes) array of fitness
+    :param aggregate: "mean", "min", or a quantile between 0 and 1 (float)
+    :return: numpy array, the fitness of every genome
+    """
+    if len(episodes) == 1:
+        return episodes[0]
+    if aggregate == "mean":
+        return episodes.mean(axis=0)
+    if aggregate == "min":
+        return episodes.min(axis=0)
+    return np.quantile(episodes, aggregate, axis=0)
 
-    run = True
-    while run and len(birds) > 0:
-        clock.tick(30)
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                pygame.quit()
-                quit()
-                break
+def threshold_reached(fitness, config):
+    """
+    checks if the population already meets neat's fitness_threshold.
+    Stopping the game right now freezes every fitness, so once this is
+    true neat is certain to end the run after this generation.
+    :param fitness: fitness of every bird (numpy array)
+    :param config: neat config
+    :return: Bool
+    """
+    if config.fitness_criterion == "max":
+        best = fitness.max()  # same as max(), without the python loop
+    else:
+        best = neat.math_util.stat_functions[config.fitness_criterion](fitness.tolist())
+    return best >= config.fitness_threshold
+
+
+class Game:
+    """
+    the world of one game: a population of birds flying a course, the
+    pipes on screen, the floor and the score. Every frame is a call to
+    start_frame, the jumps, then a call to finish_frame, so a game
+    played by networks and one replayed from a recording are the same.
+
+    A game can also fly the same birds on several courses at once. The
+    pipes move, get passed and get added at the same frames whatever
+    their heights, so every course is a lane with its own pipes and its
+    own block of size birds in the population, and they all share the
+    frames and the score. Lane 0 is the one drawn.
+    """
 
-        pipe_ind = 0
-        if len(birds) > 0:
-            if len(pipes) > 1 and birds[0].x > pipes[0].x + pipes[0].PIPE_TOP.get_width():  # determine whether to use the first or second
-                pipe_ind = 1                                                                 # pipe on the screen for neural network input
+    def __init__(self, size, course, timer=None):
+        """
+        Initialize the game
+        :param size: number of birds on each course (int)
+        :param course: Course with the pipe heights, or a list of them to fly all at once
+        :param timer: timing.PhaseTimer to measure the phases of each frame with, None to not measure
+        :return: None
+        """
+        self.timer = timer if timer is not None else NO_TIMER
+        self.courses = course if isinstance(course, list) else [course]
+        self.course = self.courses[0]
+        self.size = size
+        self.population = BirdPopulation(size * len(self.courses), 230, 350)
+        self.base = Base(FLOOR)
+        self.lanes = [[Pipe(700, course.height(0))] for course in self.courses]
+        self.pipes = self.lanes[0]
+        self.score = 0
+        self.frames = 0
+        self.pipe_ind = 0
+
+    def clone(self):
+        """
+        copies the whole state of the game, the copy plays on without
+        changing this one, so it works as a snapshot to go back to
+        :return: Game
+        """
+        game = Game.__new__(Game)
+        game.timer = self.timer
+        game.courses = self.courses
+        game.course = self.course
+        game.size = self.size
+        game.population = self.population.clone()
+        game.base = self.base.clone()
+        game.lanes = [[pipe.clone() for pipe in pipes] for pipes in self.lanes]
+        game.pipes = game.lanes[0]
+        game.score = self.score
+        game.frames = self.frames
+        game.pipe_ind = self.pipe_ind
+        return game
+
+    def lane(self, index):
+        """
+        :param index: number of the lane (int)
+        :return: slice of the population slots flying that lane's course
+        """
+        return slice(index * self.size, (index + 1) * self.size)
 
-        for x, bird in enumerate(birds):  # give each bird a fitness of 0.1 for each frame it stays alive
-            ge[x].fitness += 0.1
-            bird.move()
+    def gap(self, indices):
+        """
+        gets the pipe gap each bird looks at this frame
+        :param indices: slots of the birds (numpy int array)
+        :return: (heights, bottoms), numbers when there's only one course
+        """
+        if len(self.lanes) == 1:
+            pipe = self.pipes[self.pipe_ind]
+            return pipe.height, pipe.bottom
 
-            # send bird location, top pipe location and bottom pipe location and determine from network whether to jump or not
-            output = nets[birds.index(bird)].activate((bird.y, abs(bird.y - pipes[pipe_ind].height), abs(bird.y - pipes[pipe_ind].bottom)))
+        lanes = indices // self.size
+        heights = np.array([pipes[self.pipe_ind].height for pipes in self.lanes])
+        bottoms = np.array([pipes[self.pipe_ind].bottom for pipes in self.lanes])
+        return heights[lanes], bottoms[lanes]
 
-            if output[0] > 0.5:  # we use a tanh activation function so result will be between -1 and 1. if over 0.5 jump
-                bird.jump()
+    def genomes(self, indices):
+        """
+        :param indices: slots of birds (numpy int array)
+        :return: the index of the genome flying each of them
+        """
+        return indices if len(self.lanes) == 1 else indices % self.size
 
-        base.move()
+    def start_frame(self):
+        """
+        picks the pipe the birds look at and moves the birds, the live
+        ones earn the fitness of one more frame
+        :return: indices of the birds alive at the start of the frame
+        """
+        population = self.population
+        pipes = self.pipes
+        self.pipe_ind = 0
+        if len(pipes) > 1 and population.x > pipes[0].x + pipes[0].PIPE_TOP.get_width():  # determine whether to use the first or second
+            self.pipe_ind = 1                                                              # pipe on the screen for neural network input
+
+        alive = population.alive_indices()
+        population.move()
+        population.fitness[alive] += 0.1  # give each bird a fitness of 0.1 for each frame it stays alive
+        self.timer.count(len(alive))
+        self.timer.lap("physics")
+        return alive
+
+    def finish_frame(self, win=None):
+        """
+        moves the world once the birds have jumped, and kills the birds
+        that crashed
+        :param win: pygame window, or None when headless
+        :return: None
+        """
+        population = self.population
+        timer = self.timer
+        self.base.move()
 
-        rem = []
         add_pipe = False
-        for pipe in pipes:
-            pipe.move()
-            # check for collision
-            for bird in birds:
-                if pipe.collide(bird, win):
-                    ge[birds.index(bird)].fitness -= 1
-                    nets.pop(birds.index(bird))
-                    ge.pop(birds.index(bird))
-                    birds.pop(birds.index(bird))
-
-            if pipe.x + pipe.PIPE_TOP.get_width() < 0:
-                rem.append(pipe)
-
-            if not pipe.passed and pipe.x < bird.x:
-                pipe.passed = True
-                add_pipe = True
+        for lane, pipes in enumerate(self.lanes):
+            block = self.lane(lane) if len(self.lanes) > 1 else None
+            rem = []
+            for pipe in pipes:
+                pipe.move()
+                timer.lap("pipes")
+                # check for collision, only a pipe over the birds' column can hit them
+                if pipe.overlaps_column(population.x, Bird.WIDTH):
+                    for index in population.outside_gap(pipe, block):
+                        if pipe.collide(population.bird(index), win):
+                            population.fitness[index] -= 1
+                            population.kill(index)
+                timer.lap("collision")
+
+                if pipe.x + pipe.PIPE_TOP.get_width() < 0:
+                    rem.append(pipe)
+
+                if not pipe.passed and pipe.x < population.x:
+                    pipe.passed = True
+                    add_pipe = True
+
+            for r in rem:
+                pipes.remove(r)
 
         if add_pipe:
-            score += 1
+            self.score += 1
             # can add this line to give more reward for passing through a pipe (not required)
-            for genome in ge:
-                genome.fitness += 5
-            pipes.append(Pipe(WIN_WIDTH))
+            population.fitness[population.alive] += 5
+            for course, pipes in zip(self.courses, self.lanes):
+                pipes.append(Pipe(WIN_WIDTH, course.height(self.score)))
+        timer.lap("pipes")
+
+        # hitting the floor or flying off the top, with each bird's current image
+        img_height = Bird.IMG_HEIGHTS[population.img_index]
+        out = population.alive & ((population.y + img_height - 10 >= FLOOR) | (population.y < -50))
+        population.alive[out] = False
+        timer.lap("collision")
 
-        for r in rem:
-            pipes.remove(r)
+        # the collision mask depends on the animation frame, so every
+        # bird keeps flapping even when it isn't drawn
+        population.animate()
+
+        self.frames += 1
+        timer.lap("physics")
+
+    def draw(self, win, gen, watch_top=None, speed=1):
+        """
+        draws the game, see draw_window
+        :param win: pygame window
+        :param gen: generation shown on screen, plus one (int)
+        :param watch_top: draw only this many of the best live birds, all of them if None (int)
+        :param speed: simulation steps per drawn frame, shown when it isn't 1
+        :return: None
+        """
+        block = self.lane(0)
+        shown = self.population.best(watch_top, block)
+        alive = np.count_nonzero(self.population.alive[block])
+        draw_window(win, [self.population.bird(index) for index in shown], self.pipes, self.base, self.score, gen,
+                    self.pipe_ind, alive, speed)
+        self.timer.lap("drawing")
 
-        for bird in birds:
-            if bird.y + bird.img.get_height() - 10 >= FLOOR or bird.y < -50:
-                nets.pop(birds.index(bird))
-                ge.pop(birds.index(bird))
-                birds.pop(birds.index(bird))
 
-        draw_window(WIN, birds, pipes, base, score, gen, pipe_ind)
+def eval_genomes(genomes, config, headless=False, course=None,
+                 max_frames=None, max_score=None, max_time=None, stop_at_threshold=False,
+                 render_every=1, watch_top=None, record=None, fps=30, timer=None, aggregate="mean", cache=None):
+    """
+    runs the simulation of the current population of
+    birds and sets their fitness based on the distance they
+    reach in the game. The game ends when every bird is dead or
+    when one of the budgets runs out, then the survivors keep the
+    fitness they earned so far.
+    Given several courses, every genome flies all of them in the same
+    game, and its fitness is the aggregate of its fitness on each.
+    :param headless: run uncapped without pumping events or drawing (bool)
+    :param course: Course with the pipe heights, or a list of Courses, seeded from the random module if None
+    :param max_frames: stop after this many frames, None for no limit (int)
+    :param max_score: stop once this many pipes are passed, None for no limit (int)
+    :param max_time: stop after this many seconds of wall time, None for no limit (float)
+    :param stop_at_threshold: stop as soon as config.fitness_threshold is reached (bool)
+    :param render_every: draw only every Nth frame, with no frame cap in between if N > 1 (int).
+        While watching, the 1-4 keys switch between 1x, 4x, 16x and unbounded speed, which
+        multiplies the simulation steps between drawn frames
+    :param watch_top: draw only this many of the best live birds, all of them if None (int)
+    :param record: file to save a replay of the game to, see watch_replay, None to not record it
+    :param fps: frame rate cap when drawing every frame, None for no cap (int)
+    :param timer: timing.PhaseTimer to add the time of each phase of the game to, None to not measure
+    :param aggregate: how the fitness on several courses adds up, see aggregate_fitness
+    :param cache: fitness_cache.FitnessCache of the run, genomes it knows aren't played again, None to play all.
+        With stop_at_threshold it needs fitness_criterion = max
+    :return: number of frames simulated (int)
+    """
+    global gen, speed
+    aggregate = check_aggregate(aggregate)
+    if timer is None:
+        timer = NO_TIMER
+    timer.start()
+    win = None if headless else get_window()
+    gen += 1
+
+    if course is None:
+        course = Course(random.getrandbits(32))
+
+    if cache is not None:
+        if stop_at_threshold and config.fitness_criterion != "max":
+            # cached genomes don't fly, so the threshold stat would miss them
+            raise ValueError("only fitness_criterion = max can stop at the threshold with a fitness cache, "
+                             "got {0!r}".format(config.fitness_criterion))
+        genomes = cache.lookup(genomes, course)
+        if not genomes:
+            timer.lap("setup")
+            return 0
+
+    # every bird lives in a slot of the population, the genome and
+    # network for that bird are at the same index
+    ge = [genome for genome_id, genome in genomes]
+
+    # the networks of every genome, packed so they are all evaluated at once
+    nets = PopulationNetwork.create(ge, config)
+
+    game = Game(len(genomes), course, timer)
+    population = game.population
+    episodes = population.fitness.reshape(len(game.courses), len(genomes))  # a view, one row per course
+    if record is not None:
+        seeds = [course.seed for course in game.courses]
+        recording = Recording(seeds[0] if len(seeds) == 1 else seeds, len(population), gen - 1,
+                              [genome_id for genome_id, genome in genomes])
+
+    clock = pygame.time.Clock()
+    start = time.time()
+    timer.lap("setup")
+
+    steps = 0  # simulation steps left before the next drawn frame
+    budget_spent = False  # stopped by the frame or score budget, the same frame every time on this course
+    run = True
+    while run and population.alive.any():
+        if not headless and steps == 0:
+            # a drawn frame starts: play at game speed times the speed, unless
+            # decimating, and keep the window responsive
+            if render_every == 1 and fps and speed is not None:
+                clock.tick(fps)
+                timer.lap("waiting")
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    run = False
+                    pygame.quit()
+                    quit()
+                    break
+                if event.type == pygame.KEYDOWN and event.key in SPEED_KEYS:
+                    speed = SPEED_KEYS[event.key]
+            timer.lap("events")
+
+            steps = None if speed is None else speed * render_every
+            frame_start = time.perf_counter()
+
+        alive = game.start_frame()
+
+        # send bird location, top pipe location and bottom pipe location and determine from network whether to jump or not
+        height, bottom = game.gap(alive)
+        y = population.y[alive]
+        output = nets.activate(np.column_stack((y, np.abs(y - height), np.abs(y - bottom))), game.genomes(alive))
+        jumped = alive[output[:, 0] > 0.5]  # we use a tanh activation function so result will be between -1 and 1. if over 0.5 jump
+        population.jump(jumped)
+        timer.lap("activation")
+        if record is not None:
+            recording.record(jumped)
+            timer.lap("other")
+
+        game.finish_frame(win)
+
+        if not headless:
+            if steps is None:  # unbounded, draw when a frame's worth of time has gone by
+                render = time.perf_counter() - frame_start >= 1.0 / (fps or 30)
+            else:
+                steps -= 1
+                render = steps == 0
+            if render:
+                game.draw(win, gen, watch_top, speed)
+                steps = 0
+
+        if max_frames is not None and game.frames >= max_frames:
+            budget_spent = True
+            break
+        if max_score is not None and game.score >= max_score:
+            budget_spent = True
+            break
+        if max_time is not None and time.time() - start >= max_time:
+            break
+        if stop_at_threshold and threshold_reached(aggregate_fitness(episodes, aggregate), config):
+            break
+        timer.lap("other")
 
         # break if score gets large enough
         '''if score > 20:
-            pickle.dump(nets[0],open("best.pickle", "wb"))
+            pickle.dump(neat.nn.FeedForwardNetwork.create(ge[population.alive_indices()[0]], config),open("best.pickle", "wb"))
             break'''
 
+    timer.scored(game.score)
+    if record is not None:
+        recording.fitness = population.fitness.copy()
+        recording.save(record)
+
+    # fitness was kept in the population, hand it to the genomes once
+    fitness = aggregate_fitness(episodes, aggregate)
+    for genome, value in zip(ge, fitness):
+        genome.fitness = float(value)
+
+    if cache is not None:
+        # birds still flying when the game stopped early would have flown on, and a game
+        # stopped at the threshold would stop again
+        finished = ~population.alive.reshape(episodes.shape).any(axis=0) | budget_spent
+        if stop_at_threshold:
+            finished &= fitness < config.fitness_threshold
+        cache.store(genomes, course, finished.tolist())
+    timer.lap("other")
+
+    return game.frames
+
+
+REPLAY_KEYFRAMES = 300  # frames between the snapshots kept to seek back quickly
+
+
+def replay_frame(game, recording, win=None):
+    """
+    plays the next frame of a recording, with the recorded jumps
+    instead of the networks
+    :param game: Game being replayed
+    :param recording: replay.Recording
+    :param win: pygame window, or None when headless
+    :return: None
+    """
+    game.start_frame()
+    game.population.jump(recording.jumps(game.frames))
+    game.finish_frame(win)
+
+
+def seek_replay(recording, frame=None, score=None, game=None, keyframes=None):
+    """
+    simulates a recording headless up to a frame, or up to the frame
+    a score is reached
+    :param recording: replay.Recording
+    :param frame: frame to stop at, clamped to the recording, ignored when score is given (int)
+    :param score: stop once this many pipes are passed instead, if not None (int)
+    :param game: Game to continue from if it isn't past the frame, None to start over
+    :param keyframes: dict of frame number to Game snapshots of this recording to start
+        from and to add to every REPLAY_KEYFRAMES frames, None to not keep any
+    :return: Game
+    """
+    if frame is None or frame > len(recording) or score is not None:
+        frame = len(recording)
+    frame = max(frame, 0)
+    if game is not None and (game.frames > frame or (score is not None and game.score > score)):
+        game = None
+
+    # a snapshot closer to the frame than the game beats simulating from the game
+    if keyframes and score is None:
+        before = [k for k in keyframes if k <= frame]
+        if before and (game is None or max(before) > game.frames):
+            game = keyframes[max(before)].clone()
+    if game is None:
+        if isinstance(recording.course_seed, list):  # a game on several courses
+            courses = [Course(seed) for seed in recording.course_seed]
+            game = Game(recording.size // len(courses), courses)
+        else:
+            game = Game(recording.size, Course(recording.course_seed))
+
+    while game.frames < frame and (score is None or game.score < score):
+        replay_frame(game, recording)
+        if keyframes is not None and game.frames % REPLAY_KEYFRAMES == 0 and game.frames not in keyframes:
+            keyframes[game.frames] = game.clone()
+    return game
+
+
+def watch_replay(filename, frame=0, score=None, watch_top=None):
+    """
+    plays a recorded game in the window, no networks needed.
+    space pauses, right/left seek a second, up/down ten seconds,
+    home/end go to the start/end, . steps a frame when paused and
+    1-4 switch between 1x, 4x, 16x and unbounded speed
+    :param filename: replay saved by eval_genomes
+    :param frame: frame to start at, ignored when score is given (int)
+    :param score: start at the frame this many pipes are passed instead, if not None (int)
+    :param watch_top: draw only this many of the best live birds, all of them if None (int)
+    :return: None
+    """
+    global speed
+    recording = Recording.load(filename)
+    win = get_window()
+    keyframes = {}
+    game = seek_replay(recording, frame, score, keyframes=keyframes)
+    seeks = {pygame.K_RIGHT: 30, pygame.K_LEFT: -30, pygame.K_UP: 300, pygame.K_DOWN: -300}
 
-def run(config_file):
+    clock = pygame.time.Clock()
+    paused = False
+    while True:
+        if speed is not None:
+            clock.tick(30)
+        frame_start = time.perf_counter()
+        target = None
+        steps = 0 if paused else speed
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key in seeks:
+                    target = game.frames + seeks[event.key]
+                elif event.key == pygame.K_HOME:
+                    target = 0
+                elif event.key == pygame.K_END:
+                    target = len(recording)
+                elif event.key == pygame.K_PERIOD:
+                    steps = 1
+                elif event.key in SPEED_KEYS:
+                    speed = SPEED_KEYS[event.key]
+
+        if target is not None:
+            game = seek_replay(recording, target, game=game, keyframes=keyframes)
+        else:
+            # unbounded plays frames until it's time to draw again
+            while game.frames < len(recording) and (
+                    steps is None and time.perf_counter() - frame_start < 1.0 / 30 or steps):
+                replay_frame(game, recording, win)
+                if steps is not None:
+                    steps -= 1
+        game.draw(win, recording.generation + 1, watch_top, speed)
+
+
+def run(config_file, headless=False, workers=0, course_seed=None, fresh_course=True,
+        max_frames=None, max_score=None, max_time=None, stop_at_threshold=True,
+        render_every=1, watch_top=None, checkpoint_dir=None, checkpoint_every=5, resume=False,
+        champion_file="champion.bin", record_dir=None, timing=False, timing_log=None, start_speed=1,
+        episodes=1, aggregate="mean", islands=0, migration_interval=5, migrants=2, cache_size=10000,
+        metrics_log=None, plot_dir=None, plot_every=1):
     """
     runs the NEAT algorithm to train a neural network to play flappy bird.
     :param config_file: location of config file
-    :return: None
+    :param headless: train without a window and without the 30 fps cap (bool)
+    :param workers: evaluate each generation headless on this many processes, 0 to play in this one (int)
+    :param course_seed: seed of the pipe courses, random if None (int)
+    :param fresh_course: fly a new course every generation instead of always the same one (bool)
+    :param max_frames: frame budget of each generation, None for no limit (int)
+    :param max_score: end a generation once this many pipes are passed, None for no limit (int)
+    :param max_time: wall time budget of each generation in seconds, None for no limit (float)
+    :param stop_at_threshold: end a generation as soon as fitness_threshold is reached (bool). Ignored
+        with no_fitness_termination, and with workers unless the fitness_criterion is max
+    :param render_every: when watching, draw only every Nth frame and don't cap the frame rate (int)
+    :param watch_top: when watching, draw only this many of the best birds (int)
+    :param checkpoint_dir: directory to save checkpoints to, None for no checkpoints
+    :param checkpoint_every: generations between checkpoints (int)
+    :param resume: continue from the latest checkpoint in checkpoint_dir, if there is one (bool)
+    :param champion_file: where to export the winner's network for champion.Champion, None to skip it
+    :param record_dir: directory to save a replay of every generation to, None to not record. Only
+        games played in this process are recorded, not the ones played by workers
+    :param timing: print how long each phase of the game loop took every generation (bool)
+    :param timing_log: file to append the timing of every generation to as JSON lines, implies timing
+    :param start_speed: simulation steps per drawn frame when watching, None for unbounded, see eval_genomes
+    :param episodes: number of courses every genome flies each generation, all in one game (int)
+    :param aggregate: how the fitness of the episodes is combined, see aggregate_fitness
+    :param islands: evolve this many populations headless on their own processes instead of one, see
+        islands.run_islands. Island runs can't checkpoint, resume, record, time their generations,
+        or write a metrics log or plots, asking for any of that raises ValueError (int)
+    :param migration_interval: generations between two migrations of the islands (int)
+    :param migrants: number of best genomes an island sends each migration (int)
+    :param cache_size: number of fitness values to remember so unchanged genomes aren't played again
+        on a fixed course, see fitness_cache, 0 to always play them. Not used when stopping at the
+        threshold with a fitness_criterion other than max (int)
+    :param metrics_log: file to append the metrics of every generation to, see metrics.MetricsReporter,
+        None to keep neat's statistics in memory instead
+    :param plot_dir: directory to keep the fitness and species plots and the best network drawing up
+        to date in, drawn in the background. Logs the metrics to metrics.log in it if metrics_log is None
+    :param plot_every: generations between two updates of the plots (int)
+    :return: (winner genome, neat.StatisticsReporter of the run, or None when the statistics went to
+        metrics_log). Island runs return the merged statistics of all islands
     """
+    aggregate = check_aggregate(aggregate)
     config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
                          neat.DefaultSpeciesSet, neat.DefaultStagnation,
                          config_file)
 
-    # Create the population, which is the top-level object for a NEAT run.
-    p = neat.Population(config)
+    # neat never stops at the threshold with no_fitness_termination, so neither do the games
+    stop_at_threshold = stop_at_threshold and not config.no_fitness_termination
+
+    # the fitness of cached genomes isn't there while a game is played, which only the max
+    # criterion can do without when stopping at the threshold
+    if stop_at_threshold and config.fitness_criterion != "max":
+        cache_size = 0
+
+    if islands:
+        if workers:
+            raise ValueError("islands already use a process each, they can't use workers too")
+        if metrics_log or plot_dir:
+            raise ValueError("island runs don't write a metrics log or plots")
+        if checkpoint_dir or resume:
+            raise ValueError("island runs don't checkpoint or resume")
+        if record_dir:
+            raise ValueError("island runs don't record replays")
+        if timing or timing_log:
+            raise ValueError("island runs don't time their generations")
+        use_dummy_display()
+        winner, stats = run_islands(config_file, functools.partial(
+            eval_genomes, headless=True, stop_at_threshold=stop_at_threshold, max_frames=max_frames,
+            max_score=max_score, max_time=max_time, aggregate=aggregate),
+            islands, 50, migration_interval, migrants, course_seed, fresh_course, episodes,
+            cache_size=cache_size)
+
+        print('\nBest genome:\n{!s}'.format(winner))
+        if champion_file:
+            export_genome(winner, config, champion_file)
+            print("Exported the winner to {0}".format(champion_file))
+        return winner, stats
+
+    # Create the population, which is the top-level object for a NEAT run,
+    # or pick it up where the last checkpoint left it.
+    checkpoint = latest_checkpoint(checkpoint_dir) if resume and checkpoint_dir else None
+    if checkpoint:
+        print("Resuming from checkpoint {0}".format(checkpoint))
+        p, courses = restore_checkpoint(checkpoint, config)
+    else:
+        p = neat.Population(config)
+        courses = None
+
+    # the generation counter shown on screen
+    global gen, speed
+    gen = p.generation
+    speed = start_speed
+
+    # every genome of a generation flies the same course, or the same few
+    if courses is None:
+        courses = CourseSchedule(course_seed, fresh=fresh_course, episodes=episodes)
+
+    # a genome only flies the same game again on the same course
+    cache = FitnessCache(cache_size) if cache_size and not courses.fresh else None
 
     # Add a stdout reporter to show progress in the terminal.
     p.add_reporter(neat.StdOutReporter(True))
-    stats = neat.StatisticsReporter()
-    p.add_reporter(stats)
-    #p.add_reporter(neat.Checkpointer(5))
+    if plot_dir:
+        # the plots are drawn from the metrics log
+        os.makedirs(plot_dir, exist_ok=True)
+        if not metrics_log:
+            metrics_log = os.path.join(plot_dir, "metrics.log")
+    timer = None
+    if timing or timing_log or metrics_log:
+        timer = PhaseTimer()
+    if timing or timing_log:
+        p.add_reporter(TimingReporter(timer, timing_log))
+    stats = None
+    if metrics_log:
+        # streamed to disk instead of kept in memory for the whole run
+        p.add_reporter(MetricsReporter(timer, metrics_log))
+    else:
+        stats = neat.StatisticsReporter()
+        p.add_reporter(stats)
+    plots = None
+    if plot_dir:
+        plots = PlotService()
+        p.add_reporter(PlotReporter(plots, config, metrics_log, plot_dir, plot_every, NODE_NAMES))
+    checkpointer = None
+    if checkpoint_dir:
+        checkpointer = Checkpointer(p, checkpoint_dir, courses, generation_interval=checkpoint_every)
+
+    budgets = dict(max_frames=max_frames, max_score=max_score, max_time=max_time, aggregate=aggregate)
+
+    if workers:
+        use_dummy_display()
+        # a worker only sees its own shard, which is enough to tell only the max criterion is reached
+        shard_stop = stop_at_threshold and config.fitness_criterion == "max"
+        evaluator = ParallelEvaluator(workers, functools.partial(eval_genomes, headless=True, **budgets),
+                                      courses, stop_at_threshold=shard_stop, timer=timer, cache=cache)
+        fitness_function = evaluator.evaluate
+    else:
+        if headless:
+            use_dummy_display()
+
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+
+        def fitness_function(genomes, config):
+            record = None
+            if record_dir:
+                record = os.path.join(record_dir, "replay-{0}.npz".format(courses.generation))
+            eval_genomes(genomes, config, headless=headless, course=courses.next(),
+                         stop_at_threshold=stop_at_threshold, render_every=render_every,
+                         watch_top=watch_top, record=record, timer=timer, cache=cache, **budgets)
 
     # Run for up to 50 generations.
-    winner = p.run(eval_genomes, 50)
+    winner = p.run(fitness_function, 50 - p.generation)
+    if checkpointer is not None:
+        checkpointer.wait()
+    if plots is not None:
+        plots.close()
+    if cache is not None:
+        print("Fitness cache: {0} hits, {1} genomes played".format(cache.hits, cache.misses))
 
     # show final stats
     print('\nBest genome:\n{!s}'.format(winner))
 
+    if champion_file:
+        export_genome(winner, config, champion_file)
+        print("Exported the winner to {0}".format(champion_file))
+    return winner, stats
+
 
 if __name__ == '__main__':
     # Determine path to configuration file. This path manipulation is
@@ -438,4 +1525,79 @@ if __name__ == '__main__':
     # current working directory.
     local_dir = os.path.dirname(__file__)
     config_path = os.path.join(local_dir, 'config-feedforward.txt')
-    run(config_path)
+
+    parser = argparse.ArgumentParser(description="Train a NEAT network to play flappy bird")
+    parser.add_argument("--headless", action="store_true",
+                        help="train without a window and without the frame cap")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="evaluate headless on this many processes")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the pipe courses")
+    parser.add_argument("--fixed-course", action="store_true",
+                        help="fly the same course every generation")
+    parser.add_argument("--max-frames", type=int, default=None,
+                        help="frame budget of each generation")
+    parser.add_argument("--max-score", type=int, default=None,
+                        help="end a generation once this many pipes are passed")
+    parser.add_argument("--max-time", type=float, default=None,
+                        help="wall time budget of each generation, in seconds")
+    parser.add_argument("--render-every", type=int, default=1,
+                        help="draw only every Nth frame, uncapped in between")
+    parser.add_argument("--watch-top", type=int, default=None,
+                        help="draw only this many of the best birds")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="save a checkpoint to this directory every few generations")
+    parser.add_argument("--checkpoint-every", type=int, default=5,
+                        help="generations between checkpoints")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the latest checkpoint in --checkpoint-dir")
+    parser.add_argument("--export", default="champion.bin",
+                        help="file to export the winner's network to")
+    parser.add_argument("--record", default=None, metavar="DIR",
+                        help="save a replay of every generation to this directory")
+    parser.add_argument("--replay", default=None, metavar="FILE",
+                        help="watch a recorded game instead of training")
+    parser.add_argument("--seek", type=int, default=0, metavar="FRAME",
+                        help="start the replay at this frame")
+    parser.add_argument("--seek-pipe", type=int, default=None, metavar="SCORE",
+                        help="start the replay when this many pipes are passed, instead of at --seek")
+    parser.add_argument("--timing", action="store_true",
+                        help="print where the time of every generation goes")
+    parser.add_argument("--timing-log", default=None, metavar="FILE",
+                        help="append the timing of every generation to this file as JSON lines")
+    parser.add_argument("--speed", choices=["1", "4", "16", "max"], default="1",
+                        help="simulation speed when watching, switch it with the 1-4 keys")
+    parser.add_argument("--courses", type=int, default=1, metavar="M",
+                        help="score every genome on M courses each generation")
+    parser.add_argument("--aggregate", type=parse_aggregate, default="mean",
+                        help="fitness over the courses: mean, min or a quantile like 0.25")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help="append the metrics of every generation to this log, plot it with visualize")
+    parser.add_argument("--plot-dir", default=None, metavar="DIR",
+                        help="keep plots of the run and a drawing of the best network up to date in this directory")
+    parser.add_argument("--plot-every", type=int, default=1,
+                        help="generations between two updates of the plots")
+    parser.add_argument("--fitness-cache", type=int, default=10000, metavar="SIZE",
+                        help="remember this many fitness values on a fixed course, 0 to turn it off")
+    parser.add_argument("--islands", type=int, default=0,
+                        help="evolve this many populations on their own processes, headless")
+    parser.add_argument("--migrate-every", type=int, default=5,
+                        help="generations between two migrations of the islands")
+    parser.add_argument("--migrants", type=int, default=2,
+                        help="number of best genomes an island sends each migration")
+    args = parser.parse_args()
+    if args.replay:
+        watch_replay(args.replay, frame=args.seek, score=args.seek_pipe, watch_top=args.watch_top)
+    else:
+        run(config_path, headless=args.headless, workers=args.workers,
+            course_seed=args.seed, fresh_course=not args.fixed_course,
+            max_frames=args.max_frames, max_score=args.max_score, max_time=args.max_time,
+            render_every=args.render_every, watch_top=args.watch_top,
+            checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every, resume=args.resume,
+            champion_file=args.export, record_dir=args.record,
+            timing=args.timing, timing_log=args.timing_log,
+            start_speed=None if args.speed == "max" else int(args.speed),
+            episodes=args.courses, aggregate=args.aggregate,
+            islands=args.islands, migration_interval=args.migrate_every, migrants=args.migrants,
+            cache_size=args.fitness_cache, metrics_log=args.metrics,
+            plot_dir=args.plot_dir, plot_every=args.plot_every)
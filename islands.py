@@ -0,0 +1,254 @@
+"""
+Island model training: several populations evolving on their own cores.
+
+ParallelEvaluator still has one barrier per generation, every worker waits
+for the slowest shard before neat can reproduce. Here every island is a
+whole neat.Population in its own process, built from the same config, and
+the islands never wait for each other. Every few generations an island
+sends copies of its best genomes to the next island of the ring through a
+queue, and whatever reached its own queue replaces its newest children.
+Islands evolve apart between migrations, which keeps more diversity than
+one big population would.
+
+The main process prints what every island reports, stops them all once one
+reaches the fitness threshold, and merges their winners and statistics.
+"""
+import copy
+import multiprocessing
+import queue
+import random
+from itertools import count
+
+import neat
+
+from course import CourseSchedule
+from fitness_cache import FitnessCache
+
+
+class IslandReporter(neat.reporting.BaseReporter):
+    """
+    keeps copies of the best genomes of every generation of an island, and
+    reports each generation to the main process
+    """
+
+    def __init__(self, index, migrants, reports):
+        """
+        Initialize the reporter
+        :param index: number of the island (int)
+        :param migrants: number of genomes to keep for the next migration (int)
+        :param reports: queue to the main process
+        :return: None
+        """
+        self.index = index
+        self.migrants = migrants
+        self.reports = reports
+        self.generation = None
+        self.top = []
+        self.immigrants = 0
+        self.solved = False
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        genomes = sorted(population.values(), key=lambda genome: genome.fitness, reverse=True)
+        # copies, the originals may still be changed by reproduction
+        self.top = [copy.deepcopy(genome) for genome in genomes[:self.migrants]]
+
+        fitness = [genome.fitness for genome in genomes]
+        self.reports.put(("generation", self.index, {
+            "generation": self.generation,
+            "best": best_genome.fitness,
+            "mean": sum(fitness) / len(fitness),
+            "species": len(species.species),
+            "immigrants": self.immigrants,
+        }))
+        self.immigrants = 0
+
+    def found_solution(self, config, generation, best):
+        # with no_fitness_termination this is called after every run, solved or not
+        if not config.no_fitness_termination:
+            self.solved = True
+
+
+def immigrate(population, migrants):
+    """
+    puts genomes from another island in place of the newest children of a
+    population, between two generations
+    :param population: neat.Population
+    :param migrants: list of genomes
+    :return: number of genomes that moved in (int)
+    """
+    config = population.config
+    reproduction = population.reproduction
+    # elites keep their fitness, children don't have one yet
+    children = sorted(key for key, genome in population.population.items() if genome.fitness is None)
+    replaced = children[max(0, len(children) - len(migrants)):] if migrants else []
+
+    for key, genome in zip(replaced, migrants):
+        del population.population[key]
+        reproduction.ancestors.pop(key, None)
+        # keys are only unique within an island
+        genome.key = next(reproduction.genome_indexer)
+        genome.fitness = None
+        population.population[genome.key] = genome
+        reproduction.ancestors[genome.key] = tuple()
+
+    # new nodes must get keys no genome of this island uses, migrants included
+    genome_config = config.genome_config
+    highest = max(key for genome in population.population.values() for key in genome.nodes)
+    value = next(genome_config.node_indexer) if genome_config.node_indexer is not None else 0
+    genome_config.node_indexer = count(max(value, highest + 1))
+
+    population.species.speciate(config, population.population, population.generation)
+    return len(replaced)
+
+
+def island_main(index, config_file, eval_function, options, inbox, neighbour, reports, done):
+    """
+    evolves one island, in its own process
+    :param index: number of the island (int)
+    :param config_file: location of the neat config file
+    :param eval_function: function(genomes, config, course, cache) that sets genome.fitness, like eval_genomes
+    :param options: dict with the seed, fresh, episodes, generations, migration_interval, migrants and
+        cache_size of the run
+    :param inbox: queue other islands send this one genomes through
+    :param neighbour: queue of the next island
+    :param reports: queue to the main process
+    :param done: event set once any island reached the fitness threshold
+    :return: None
+    """
+    # forked islands would otherwise all start from the same random state
+    random.seed("island:{0}:{1}".format(options["seed"], index))
+    # the neighbour may be gone by the time this island ends, its queue is never read again
+    neighbour.cancel_join_thread()
+
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                                neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                                config_file)
+    p = neat.Population(config)
+    stats = neat.StatisticsReporter()
+    p.add_reporter(stats)
+    reporter = IslandReporter(index, options["migrants"], reports)
+    p.add_reporter(reporter)
+
+    # every island flies the same courses, so their fitness can be compared
+    courses = CourseSchedule(options["seed"], fresh=options["fresh"], episodes=options["episodes"])
+    cache = FitnessCache(options["cache_size"]) if options["cache_size"] and not options["fresh"] else None
+
+    def fitness_function(genomes, config):
+        eval_function(genomes, config, course=courses.next(), cache=cache)
+
+    while p.generation < options["generations"] and not done.is_set():
+        p.run(fitness_function, 1)
+        if reporter.solved:
+            done.set()
+            break
+
+        if p.generation % options["migration_interval"] == 0:
+            neighbour.put(reporter.top)
+        migrants = []
+        while True:
+            try:
+                migrants += inbox.get_nowait()
+            except queue.Empty:
+                break
+        if migrants:
+            reporter.immigrants += immigrate(p, migrants)
+
+    reports.put(("finished", index, (p.best_genome, stats)))
+
+
+def merge_statistics(statistics):
+    """
+    merges the statistics of every island, generation by generation. Every
+    island numbers its species from 1, so the merged species get new ids in
+    the order they first appear, and merged.species_islands maps each new
+    id back to (island, species id).
+    :param statistics: list of neat.StatisticsReporter, one per island
+    :return: neat.StatisticsReporter
+    """
+    merged = neat.StatisticsReporter()
+    ids = {}  # (island, species id) -> merged species id
+    for generation in range(max(len(stats.most_fit_genomes) for stats in statistics)):
+        islands = [(i, stats) for i, stats in enumerate(statistics) if generation < len(stats.most_fit_genomes)]
+        merged.most_fit_genomes.append(max((stats.most_fit_genomes[generation] for i, stats in islands),
+                                           key=lambda genome: genome.fitness))
+        species = {}
+        for i, stats in islands:
+            for sid, fitness in sorted(stats.generation_statistics[generation].items()):
+                species[ids.setdefault((i, sid), len(ids) + 1)] = fitness
+        merged.generation_statistics.append(species)
+    merged.species_islands = dict((new_id, key) for key, new_id in ids.items())
+    return merged
+
+
+def run_islands(config_file, eval_function, islands=4, generations=50, migration_interval=5, migrants=2,
+                course_seed=None, fresh_course=True, episodes=1, timeout=None, cache_size=0):
+    """
+    evolves several islands at once and merges their results
+    :param config_file: location of the neat config file
+    :param eval_function: function(genomes, config, course, cache) that sets genome.fitness. It must be
+        picklable, so a module level function or a partial of one
+    :param islands: number of islands, one process each (int)
+    :param generations: generations every island evolves at most (int)
+    :param migration_interval: generations between two migrations (int)
+    :param migrants: number of best genomes an island sends each migration (int)
+    :param course_seed: seed of the pipe courses, random if None (int)
+    :param fresh_course: fly a new course every generation instead of always the same one (bool)
+    :param episodes: number of courses every genome flies each generation (int)
+    :param timeout: seconds to wait for any island to report before giving up, None to wait forever
+    :param cache_size: size of the fitness cache of every island on a fixed course, 0 for none (int)
+    :return: (best genome of all islands, merged neat.StatisticsReporter)
+    """
+    if course_seed is None:
+        course_seed = random.getrandbits(32)
+    options = dict(seed=course_seed, fresh=fresh_course, episodes=episodes, generations=generations,
+                   migration_interval=migration_interval, migrants=migrants, cache_size=cache_size)
+
+    inboxes = [multiprocessing.Queue() for _ in range(islands)]
+    reports = multiprocessing.Queue()
+    done = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=island_main, daemon=True,
+                                         args=(i, config_file, eval_function, options, inboxes[i],
+                                               inboxes[(i + 1) % islands], reports, done))
+                 for i in range(islands)]
+    for process in processes:
+        process.start()
+
+    finished = {}
+    waited = 0.0
+    while len(finished) < islands:
+        try:
+            kind, index, payload = reports.get(timeout=1.0)
+        except queue.Empty:
+            waited += 1.0
+            crashed = [i for i, process in enumerate(processes) if i not in finished and not process.is_alive()]
+            if crashed:
+                done.set()
+                raise RuntimeError("Island {0} stopped without finishing".format(crashed[0]))
+            if timeout is not None and waited >= timeout:
+                done.set()
+                raise RuntimeError("No island reported for {0} seconds".format(timeout))
+            continue
+
+        waited = 0.0
+        if kind == "generation":
+            print("Island {0} generation {1}: best {2:.3f}, mean {3:.3f}, {4} species, {5} immigrants".format(
+                index, payload["generation"], payload["best"], payload["mean"], payload["species"],
+                payload["immigrants"]))
+        else:
+            finished[index] = payload
+
+    for process in processes:
+        process.join()
+
+    winners = [finished[i][0] for i in range(islands)]
+    winner = max(winners, key=lambda genome: genome.fitness)
+    stats = merge_statistics([finished[i][1] for i in range(islands)])
+
+    print("\nAll islands:")
+    for generation, (best, mean) in enumerate(zip(stats.most_fit_genomes, stats.get_fitness_mean())):
+        print("Generation {0}: best {1:.3f}, mean {2:.3f}".format(generation, best.fitness, mean))
+    print("Best genome came from island {0}".format(winners.index(winner)))
+    return winner, stats
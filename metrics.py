@@ -0,0 +1,173 @@
+"""
+An append-only log of training metrics, one fixed-width record per generation.
+
+neat.StatisticsReporter keeps every generation's best genome and fitness
+list in memory until the run ends. MetricsReporter writes a record to disk
+as each generation ends and keeps nothing, so a run of any length uses the
+same memory, and read_metrics can load the log while the run is still
+going (visualize.plot_stats_file and plot_species_file plot it).
+
+Two files make up a log:
+    filename: a header, then one GENERATION_DTYPE record per generation
+    filename + ".species": a header, then one SPECIES_DTYPE record per species per generation
+Each header is the magic "FBML", its length (uint32) and the record's numpy
+dtype as JSON, so numpy reads the records as columns straight from the file.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+from timing import PHASES, TimingReporter
+
+
+MAGIC = b"FBML"
+HEADER = struct.Struct("<4sI")
+
+GENERATION_DTYPE = np.dtype([
+    ("generation", "<i4"),
+    ("population", "<i4"),
+    ("species", "<i4"),
+    ("best", "<f8"),
+    ("mean", "<f8"),
+    ("stdev", "<f8"),
+    ("score", "<i4"),
+    ("frames", "<i8"),
+    ("bird_frames", "<i8"),
+    ("wall", "<f8"),
+    ("reproduction", "<f8"),  # NaN for the last generation, which doesn't reproduce
+] + [(phase, "<f8") for phase in PHASES])
+
+SPECIES_DTYPE = np.dtype([
+    ("generation", "<i4"),
+    ("species", "<i4"),
+    ("size", "<i4"),
+    ("best", "<f8"),
+])
+
+
+def species_filename(filename):
+    return filename + ".species"
+
+
+def write_header(f, dtype):
+    descr = json.dumps(dtype.descr).encode("utf-8")
+    f.write(HEADER.pack(MAGIC, len(descr)))
+    f.write(descr)
+
+
+def read_header(f, filename):
+    """
+    :return: numpy dtype of the records that follow
+    """
+    magic, length = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a metrics log: {0}".format(filename))
+    return np.dtype([tuple(field) for field in json.loads(f.read(length).decode("utf-8"))])
+
+
+def read_records(filename, dtype):
+    """
+    reads every whole record of a log file, a record still being written is left out
+    :param filename: path of the file
+    :param dtype: dtype the records must have
+    :return: numpy structured array
+    """
+    with open(filename, "rb") as f:
+        if read_header(f, filename) != dtype:
+            raise ValueError("Unsupported metrics log layout in {0}".format(filename))
+        data = f.read()
+    count = len(data) // dtype.itemsize
+    return np.frombuffer(data[:count * dtype.itemsize], dtype=dtype)
+
+
+def read_metrics(filename):
+    """
+    loads a metrics log, also while the run writing it is still going
+    :param filename: path of the log
+    :return: (GENERATION_DTYPE array, SPECIES_DTYPE array)
+    """
+    return read_records(filename, GENERATION_DTYPE), read_records(species_filename(filename), SPECIES_DTYPE)
+
+
+def open_log(filename, dtype, generation):
+    """
+    opens a log file to append to, creating it or dropping the records of
+    generation and later ones, which a resumed run plays again
+    :param filename: path of the file
+    :param dtype: dtype of the records
+    :param generation: first generation that will be written (int)
+    :return: None
+    """
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        with open(filename, "wb") as f:
+            write_header(f, dtype)
+        return
+
+    records = read_records(filename, dtype)
+    keep = int(np.searchsorted(records["generation"], generation))
+    with open(filename, "rb+") as f:
+        read_header(f, filename)
+        f.truncate(f.tell() + keep * dtype.itemsize)
+
+
+class MetricsReporter(TimingReporter):
+    """
+    appends the fitness, species, score, frames and timing of every
+    generation to a metrics log, keeping nothing in memory
+    """
+
+    def __init__(self, timer, filename):
+        """
+        Initialize the reporter
+        :param timer: timing.PhaseTimer eval_genomes is given
+        :param filename: path of the log, the species go next to it
+        :return: None
+        """
+        TimingReporter.__init__(self, timer, filename)
+        self.opened = False
+
+    def start_generation(self, generation):
+        if not self.opened:
+            open_log(self.filename, GENERATION_DTYPE, generation)
+            open_log(species_filename(self.filename), SPECIES_DTYPE, generation)
+            self.opened = True
+        TimingReporter.start_generation(self, generation)
+
+    def post_evaluate(self, config, population, species, best_genome):
+        TimingReporter.post_evaluate(self, config, population, species, best_genome)
+        fitness = np.array([genome.fitness for genome in population.values()], dtype=np.float64)
+        self.pending.update({
+            "population": len(fitness),
+            "best": best_genome.fitness,
+            "mean": fitness.mean(),
+            "stdev": fitness.std(),  # same as neat's stdev, over the whole population
+            "score": self.timer.score,
+            "species_sizes": [(sid, len(s.members), max(population[key].fitness for key in s.members))
+                              for sid, s in sorted(species.species.items())],
+        })
+
+    def report(self, entry):
+        """
+        appends the records of a generation
+        :param entry: dict made by post_evaluate
+        :return: None
+        """
+        record = np.zeros(1, dtype=GENERATION_DTYPE)
+        for field in ("generation", "population", "best", "mean", "stdev", "score", "frames", "bird_frames", "wall"):
+            record[field] = entry[field]
+        record["species"] = len(entry["species_sizes"])
+        record["reproduction"] = np.nan if entry["reproduction"] is None else entry["reproduction"]
+        for phase, seconds in entry["phases"].items():
+            record[phase] = seconds
+
+        species = np.zeros(len(entry["species_sizes"]), dtype=SPECIES_DTYPE)
+        for i, (sid, size, best) in enumerate(entry["species_sizes"]):
+            species[i] = (entry["generation"], sid, size, best)
+
+        # species first, so a generation in the main log always has its species
+        with open(species_filename(self.filename), "ab") as f:
+            f.write(species.tobytes())
+        with open(self.filename, "ab") as f:
+            f.write(record.tobytes())
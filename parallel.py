@@ -0,0 +1,128 @@
+"""
+Runs the evaluation of a generation on several cores.
+
+Works like neat.ParallelEvaluator, but instead of one genome per task
+every worker plays a whole headless game with a shard of the population.
+All shards fly the same pipe course, and birds never interact with each
+other, so the fitness of a genome doesn't depend on the number of workers.
+
+Stopping at the fitness threshold is the one thing shards can't decide on
+their own: the whole population stops at the first frame any bird reaches
+it. Shards that played longer than that are played again, cut at that frame.
+
+With a FitnessCache, the genomes it knows are left out before sharding, and
+every shard fills a cache of its own that is merged back afterwards.
+"""
+from multiprocessing import Pool
+
+from course import CourseSchedule
+from fitness_cache import FitnessCache
+from timing import PhaseTimer
+
+
+def evaluate_shard(eval_function, genomes, config, course, **kwargs):
+    """
+    plays one game with a shard of the population, in a worker process
+    :param eval_function: function(genomes, config, course, **kwargs) that sets genome.fitness
+    :param genomes: list of (genome_id, genome) tuples
+    :param config: neat config
+    :param course: Course every shard flies
+    :return: (list of fitness in the same order as genomes, frames played, the timer keyword or None,
+        the cache keyword or None)
+    """
+    frames = eval_function(genomes, config, course=course, **kwargs)
+    return [genome.fitness for genome_id, genome in genomes], frames, kwargs.get("timer"), kwargs.get("cache")
+
+
+class ParallelEvaluator(object):
+    """
+    evaluates each generation as one headless game per worker
+    """
+
+    def __init__(self, num_workers, eval_function, courses=None, stop_at_threshold=False, timeout=None,
+                 timer=None, cache=None):
+        """
+        eval_function should take a list of (genome_id, genome) tuples, the
+        config and the course, max_frames and stop_at_threshold keywords, set
+        the fitness of every genome and return the number of frames played,
+        like eval_genomes. It must be picklable, so a module level function
+        or a partial of one.
+        :param num_workers: number of worker processes (int)
+        :param eval_function: function(genomes, config, course, ...)
+        :param courses: CourseSchedule, a fresh random course every generation if None
+        :param stop_at_threshold: end the generation at the first frame the fitness threshold is reached (bool)
+        :param timeout: seconds to wait for a shard, None to wait forever
+        :param timer: timing.PhaseTimer to add the time measured in every worker to, None to not measure
+        :param cache: fitness_cache.FitnessCache of the run, None to play every genome
+        """
+        self.num_workers = num_workers
+        self.eval_function = eval_function
+        self.courses = courses if courses is not None else CourseSchedule()
+        self.stop_at_threshold = stop_at_threshold
+        self.timeout = timeout
+        self.timer = timer
+        self.cache = cache
+        self.pool = Pool(num_workers)
+
+    def __del__(self):
+        self.pool.close()
+        self.pool.join()
+
+    def evaluate(self, genomes, config):
+        """
+        splits the population in one shard per worker and plays them all
+        on the same course
+        :param genomes: list of (genome_id, genome) tuples
+        :param config: neat config
+        :return: None
+        """
+        if self.stop_at_threshold and config.fitness_criterion != "max":
+            raise ValueError("only fitness_criterion = max can be checked shard by shard, "
+                             "got {0!r}".format(config.fitness_criterion))
+
+        course = self.courses.next()
+        if self.cache is not None:
+            genomes = self.cache.lookup(genomes, course)
+            if not genomes:
+                return
+        size = -(-len(genomes) // self.num_workers)
+        shards = [genomes[i:i + size] for i in range(0, len(genomes), size)]
+        results = self.play(shards, config, course, stop_at_threshold=self.stop_at_threshold)
+
+        if self.stop_at_threshold:
+            stops = [frames for fitness, frames, timer, cache in results if max(fitness) >= config.fitness_threshold]
+            if stops:
+                stop = min(stops)
+                longer = [i for i, (fitness, frames, timer, cache) in enumerate(results) if frames > stop]
+                replayed = self.play([shards[i] for i in longer], config, course, max_frames=stop)
+                for i, result in zip(longer, replayed):
+                    results[i] = result
+
+        # assign the fitness back to each genome
+        for shard, (fitness, frames, timer, cache) in zip(shards, results):
+            for (genome_id, genome), value in zip(shard, fitness):
+                genome.fitness = value
+            if cache is not None:
+                self.cache.update(cache)
+
+    def play(self, shards, config, course, **kwargs):
+        """
+        plays every shard on the pool and waits for all of them
+        :param shards: list of lists of (genome_id, genome) tuples
+        :param config: neat config
+        :param course: Course every shard flies
+        :return: list of (fitness list, frames played, timer or None, cache or None), one per shard
+        """
+        if self.timer is not None:
+            kwargs["timer"] = PhaseTimer()
+        if self.cache is not None:
+            kwargs["cache"] = FitnessCache(self.cache.max_size)
+        jobs = [self.pool.apply_async(evaluate_shard, (self.eval_function, shard, config, course), kwargs)
+                for shard in shards]
+        results = [job.get(timeout=self.timeout) for job in jobs]
+
+        # every shard played, replayed or not, took its time
+        for fitness, frames, timer, cache in results:
+            if timer is not None:
+                self.timer.add(timer)
+        return results
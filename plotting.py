@@ -0,0 +1,187 @@
+"""
+Plots and network diagrams drawn off the training thread.
+
+matplotlib and graphviz take seconds to draw, and calling visualize between
+generations held evolution up for that long. PlotService hands every plot
+to a worker process instead, so submitting one is a dict update. A request
+for a file replaces any request for the same file that hasn't been drawn
+yet, so a slow plot never builds up a backlog, and a network drawing is
+skipped when the network is the one already drawn to that file.
+"""
+import copy
+import hashlib
+import multiprocessing
+import os
+import threading
+
+import neat
+
+import visualize
+
+
+def net_hash(genome):
+    """
+    hashes everything visualize.draw_net draws: the nodes, and every
+    connection with whether it's enabled and its weight
+    :param genome: neat genome
+    :return: bytes
+    """
+    connections = sorted((key, cg.enabled, cg.weight) for key, cg in genome.connections.items())
+    return hashlib.blake2b(repr((sorted(genome.nodes), connections)).encode("ascii"), digest_size=16).digest()
+
+
+def start_worker():
+    # the worker only ever draws to files
+    os.environ.setdefault("MPLBACKEND", "Agg")
+
+
+def render(name, args, kwargs):
+    """
+    draws one plot, in the worker process
+    :param name: name of a visualize function
+    :param args: its positional arguments
+    :param kwargs: its keyword arguments
+    :return: None
+    """
+    try:
+        getattr(visualize, name)(*args, **kwargs)
+    except Exception as e:
+        # a plot that fails must not take the service down with it
+        print("Drawing {0} failed: {1!r}".format(name, e))
+
+
+class PlotService:
+    """
+    draws visualize plots in a background process, newest request per file first
+    """
+
+    def __init__(self):
+        self.pending = {}  # output file -> (function name, args, kwargs), in the order they came in
+        self.drawn = {}  # output file -> net_hash of the genome drawn there
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closing = False
+        self.pool = multiprocessing.Pool(1, initializer=start_worker)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def submit(self, target, name, *args, **kwargs):
+        """
+        queues a plot, replacing one for the same file that wasn't drawn yet
+        :param target: file the plot is drawn to, identifies the request
+        :param name: name of the visualize function to call
+        :return: None
+        """
+        with self.lock:
+            self.pending.pop(target, None)
+            self.pending[target] = (name, args, kwargs)
+        self.wake.set()
+
+    def plot_stats(self, metrics_file, filename="avg_fitness.svg", ylog=False):
+        """
+        queues visualize.plot_stats_file
+        """
+        self.submit(filename, "plot_stats_file", metrics_file, ylog=ylog, filename=filename)
+
+    def plot_species(self, metrics_file, filename="speciation.svg"):
+        """
+        queues visualize.plot_species_file
+        """
+        self.submit(filename, "plot_species_file", metrics_file, filename=filename)
+
+    def draw_net(self, config, genome, filename, node_names=None):
+        """
+        queues visualize.draw_net, unless that network is already drawn to filename
+        :param config: neat config
+        :param genome: neat genome, copied as it is now
+        :param filename: file name graphviz renders to, without the extension
+        :param node_names: dict of node key to label
+        :return: None
+        """
+        key = net_hash(genome)
+        if self.drawn.get(filename) == key:
+            return
+        self.drawn[filename] = key
+        self.submit(filename, "draw_net", config, copy.deepcopy(genome), filename=filename, node_names=node_names)
+
+    def serve(self):
+        """
+        hands the requests to the worker one at a time, on the service thread
+        :return: None
+        """
+        while True:
+            self.wake.wait()
+            with self.lock:
+                if not self.pending:
+                    self.wake.clear()
+                    if self.closing:
+                        return
+                    continue
+                filename = next(iter(self.pending))
+                name, args, kwargs = self.pending.pop(filename)
+            self.pool.apply(render, (name, args, kwargs))
+
+    def close(self):
+        """
+        draws what's still queued and stops the worker
+        :return: None
+        """
+        with self.lock:
+            self.closing = True
+        self.wake.set()
+        self.thread.join()
+        self.pool.close()
+        self.pool.join()
+
+
+class PlotReporter(neat.reporting.BaseReporter):
+    """
+    plots a metrics log and draws the best network every few generations,
+    through a PlotService. Add it after the metrics.MetricsReporter that
+    writes the log, so each generation is in the log when it's plotted.
+    """
+
+    def __init__(self, service, config, metrics_file, directory, generation_interval=1, node_names=None):
+        """
+        Initialize the reporter
+        :param service: PlotService
+        :param config: neat config
+        :param metrics_file: path of the metrics log
+        :param directory: directory to draw to
+        :param generation_interval: generations between two plots (int)
+        :param node_names: dict of node key to label for the network drawing
+        :return: None
+        """
+        self.service = service
+        self.config = config
+        self.metrics_file = metrics_file
+        self.directory = directory
+        self.generation_interval = generation_interval
+        self.node_names = node_names
+        self.generation = None
+        self.best = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        if self.best is None or best_genome.fitness > self.best.fitness:
+            self.best = best_genome
+
+    def end_generation(self, config, population, species_set):
+        if self.generation % self.generation_interval == 0:
+            self.plot()
+
+    def found_solution(self, config, generation, best):
+        self.plot()
+
+    def plot(self):
+        """
+        queues the plots of the log so far and the best network so far
+        :return: None
+        """
+        self.service.plot_stats(self.metrics_file, os.path.join(self.directory, "avg_fitness.svg"))
+        self.service.plot_species(self.metrics_file, os.path.join(self.directory, "speciation.svg"))
+        if self.best is not None:
+            self.service.draw_net(self.config, self.best, os.path.join(self.directory, "best_net"),
+                                  self.node_names)
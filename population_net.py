@@ -0,0 +1,270 @@
+"""
+Evaluates the feed forward networks of a whole generation at once.
+
+neat.nn.FeedForwardNetwork.activate walks one network node by node in
+python, so a population of birds costs one graph walk per bird per frame.
+PopulationNetwork packs every genome of a generation into padded numpy
+arrays, layer by layer, so a single activate call decides for every
+live bird with a handful of matrix operations.
+
+Working out the layers of a genome is most of the cost of packing it, and
+most genomes only differ from their parents by weights and biases. The
+layers, and where every node and connection goes in them, are cached by
+topology in a TopologyCache, and only genomes with a new topology are
+laid out again.
+"""
+from collections import OrderedDict
+
+import numpy as np
+from neat.graphs import feed_forward_layers
+
+
+# numpy versions of the neat activation functions, with the same clamping
+ACTIVATIONS = {
+    "sigmoid": lambda z: 1.0 / (1.0 + np.exp(-np.clip(5.0 * z, -60.0, 60.0))),
+    "tanh": lambda z: np.tanh(np.clip(2.5 * z, -60.0, 60.0)),
+    "sin": lambda z: np.sin(np.clip(5.0 * z, -60.0, 60.0)),
+    "gauss": lambda z: np.exp(-5.0 * np.clip(z, -3.4, 3.4) ** 2),
+    "relu": lambda z: np.maximum(z, 0.0),
+    "identity": lambda z: z,
+    "clamped": lambda z: np.clip(z, -1.0, 1.0),
+}
+
+
+class Layer:
+    """
+    one topological layer of every network in the population
+    """
+
+    def __init__(self, weights, bias, response, activations):
+        """
+        Initialize the layer
+        :param weights: (networks, values before this layer, width) array
+        :param bias: (networks, width) array
+        :param response: (networks, width) array
+        :param activations: activation name of every (network, node) slot
+        :return: None
+        """
+        self.weights = weights
+        self.bias = bias
+        self.response = response
+
+        # most configs use a single activation, so skip the masking for those
+        names = set(activations.flat)
+        names.discard(None)
+        if len(names) <= 1:
+            self.activation = ACTIVATIONS[names.pop() if names else "identity"]
+            self.masks = None
+        else:
+            self.activation = None
+            self.masks = [(ACTIVATIONS[name], activations == name) for name in names]
+
+    def activate(self, values, rows):
+        """
+        computes the values of the nodes in this layer
+        :param values: values of the inputs and all earlier layers (array)
+        :param rows: networks being evaluated, or None for all of them
+        :return: (len(rows), width) array
+        """
+        if rows is None:
+            weights, bias, response = self.weights, self.bias, self.response
+        else:
+            weights, bias, response = self.weights[rows], self.bias[rows], self.response[rows]
+
+        # sum aggregation, accumulated slot by slot rather than with matmul so the
+        # result doesn't depend on how much padding the other genomes added
+        s = np.zeros_like(bias)
+        for k in range(values.shape[1]):
+            s += values[:, k, None] * weights[:, k, :]
+        z = bias + response * s
+
+        if self.masks is None:
+            return self.activation(z)
+
+        out = np.zeros_like(z)
+        masks = self.masks if rows is None else [(f, mask[rows]) for f, mask in self.masks]
+        for activation, mask in masks:
+            out[mask] = activation(z[mask])
+        return out
+
+
+class Topology:
+    """
+    the layout of every genome with the same inputs, outputs and enabled
+    connections: its layers and where each node and connection goes
+    """
+
+    def __init__(self, input_keys, output_keys, connections):
+        """
+        Initialize the topology, same layers as FeedForwardNetwork.create
+        :param input_keys: list of input node keys
+        :param output_keys: list of output node keys
+        :param connections: enabled connection keys
+        :return: None
+        """
+        self.layers = [tuple(sorted(layer)) for layer in feed_forward_layers(input_keys, output_keys, connections)]
+
+        # (layer, index) of every value, inputs are layer -1
+        places = dict((key, (-1, i)) for i, key in enumerate(input_keys))
+        for l, layer in enumerate(self.layers):
+            for i, node in enumerate(layer):
+                places[node] = (l, i)
+
+        # connections into nodes that are never evaluated are dropped, like neat does
+        self.links = [(key, places[key[0]], places[key[1]]) for key in connections
+                      if key[1] in places and places[key[1]][0] >= 0]
+        # outputs that no path reaches stay at 0.0
+        self.outputs = [places.get(key) for key in output_keys]
+
+
+class TopologyCache:
+    """
+    the Topology of recently packed genomes, forgetting the least recently
+    used ones first
+    """
+
+    def __init__(self, max_size=10000):
+        """
+        Initialize the cache
+        :param max_size: number of topologies to keep at most (int)
+        :return: None
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, genome, input_keys, output_keys):
+        """
+        gets the topology of a genome, laying it out if it's new
+        :param genome: neat genome
+        :param input_keys: list of input node keys
+        :param output_keys: list of output node keys
+        :return: Topology
+        """
+        connections = tuple(sorted(cg.key for cg in genome.connections.values() if cg.enabled))
+        key = (tuple(input_keys), tuple(output_keys), connections)
+        topology = self.entries.get(key)
+        if topology is None:
+            self.misses += 1
+            topology = self.entries[key] = Topology(input_keys, output_keys, connections)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return topology
+
+
+# shared by every create call of this process, so each generation reuses the last one's
+TOPOLOGIES = TopologyCache()
+
+
+class PopulationNetwork:
+    """
+    the feed forward networks of a list of genomes, packed into padded
+    weight, bias and adjacency arrays and evaluated all together
+    """
+
+    def __init__(self, num_inputs, layers, offsets, output_slots):
+        """
+        Initialize the network, see PopulationNetwork.create
+        :param num_inputs: number of network inputs (int)
+        :param layers: list of Layer
+        :param offsets: first value slot of every layer, plus the total number of slots
+        :param output_slots: (networks, outputs) array with the value slot of every output
+        :return: None
+        """
+        self.num_inputs = num_inputs
+        self.layers = layers
+        self.offsets = offsets
+        self.output_slots = output_slots
+
+    def __len__(self):
+        return len(self.output_slots)
+
+    def activate(self, inputs, rows=None):
+        """
+        evaluates the networks, same as calling FeedForwardNetwork.activate
+        on each one of them
+        :param inputs: (len(rows), num_inputs) array, one row per network
+        :param rows: indices of the networks to evaluate, all of them if None
+        :return: (len(rows), num_outputs) array
+        """
+        inputs = np.asarray(inputs, dtype=np.float64)
+        if inputs.ndim != 2 or inputs.shape[1] != self.num_inputs:
+            raise RuntimeError("Expected {0:n} inputs per network, got shape {1}".format(self.num_inputs, inputs.shape))
+
+        # slot 0 always holds 0.0, it's where unreachable outputs point
+        values = np.zeros((len(inputs), self.offsets[-1]))
+        values[:, 1:1 + self.num_inputs] = inputs
+        for layer, start, end in zip(self.layers, self.offsets, self.offsets[1:]):
+            values[:, start:end] = layer.activate(values[:, :start], rows)
+
+        output_slots = self.output_slots if rows is None else self.output_slots[rows]
+        return np.take_along_axis(values, output_slots, axis=1)
+
+    @staticmethod
+    def create(genomes, config, topologies=None):
+        """
+        Receives a list of genomes and returns their phenotypes packed
+        into a single PopulationNetwork, one row per genome.
+        :param genomes: list of neat genomes
+        :param config: neat config
+        :param topologies: TopologyCache to look the layers of the genomes up in, the shared one if None
+        :return: PopulationNetwork
+        """
+        genome_config = config.genome_config
+        input_keys = genome_config.input_keys
+        output_keys = genome_config.output_keys
+        n = len(genomes)
+        if topologies is None:
+            topologies = TOPOLOGIES
+
+        # topological layers of every genome, same as FeedForwardNetwork.create
+        genome_topologies = [topologies.get(genome, input_keys, output_keys) for genome in genomes]
+
+        num_layers = max([len(topology.layers) for topology in genome_topologies] + [0])
+        widths = [max(len(topology.layers[l]) if l < len(topology.layers) else 0 for topology in genome_topologies)
+                  for l in range(num_layers)]
+
+        # value slots: the zero slot, then the inputs, then each layer padded to its widest genome
+        offsets = [1 + len(input_keys)]
+        for width in widths:
+            offsets.append(offsets[-1] + width)
+
+        weights = [np.zeros((n, offsets[l], widths[l])) for l in range(num_layers)]
+        bias = [np.zeros((n, width)) for width in widths]
+        response = [np.ones((n, width)) for width in widths]
+        activations = [np.full((n, width), None, dtype=object) for width in widths]
+        output_slots = np.zeros((n, len(output_keys)), dtype=np.intp)
+
+        # first value slot of the inputs, then of each layer
+        starts = [1] + offsets
+
+        for row, (genome, topology) in enumerate(zip(genomes, genome_topologies)):
+            for l, layer in enumerate(topology.layers):
+                for i, node in enumerate(layer):
+                    ng = genome.nodes[node]
+                    if ng.aggregation != "sum":
+                        raise ValueError("PopulationNetwork only supports sum aggregation, got {0!r}".format(ng.aggregation))
+                    if ng.activation not in ACTIVATIONS:
+                        raise ValueError("PopulationNetwork does not support the {0!r} activation".format(ng.activation))
+
+                    bias[l][row, i] = ng.bias
+                    response[l][row, i] = ng.response
+                    activations[l][row, i] = ng.activation
+
+            connections = genome.connections
+            for key, (source_layer, source), (l, i) in topology.links:
+                weights[l][row, starts[source_layer + 1] + source, i] += connections[key].weight
+
+            for i, place in enumerate(topology.outputs):
+                if place is not None:
+                    output_slots[row, i] = starts[place[0] + 1] + place[1]
+
+        layers = [Layer(weights[l], bias[l], response[l], activations[l]) for l in range(num_layers)]
+        return PopulationNetwork(len(input_keys), layers, offsets, output_slots)
@@ -0,0 +1,102 @@
+"""
+Replays of a game, recorded as the jumps of every frame.
+
+The birds only ever decide whether to jump, and everything else in a game
+follows from the pipe course, so a game is the course seed plus one bit
+per bird per frame. A Recording keeps those bits packed in a numpy array;
+playing them back (see flappy_bird.watch_replay) needs no networks at all,
+and any frame can be reached by simulating the frames before it headless.
+"""
+import json
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+
+
+class Recording:
+    """
+    the jumps of every bird in every frame of one game
+    """
+
+    def __init__(self, course_seed, size, generation=0, genome_ids=None, jumps=None, fitness=None):
+        """
+        Initialize the recording
+        :param course_seed: seed of the Course the game was played on (int), or list of seeds
+            of the courses the birds flew all at once
+        :param size: number of birds, on all courses together (int)
+        :param generation: generation the game was played in (int)
+        :param genome_ids: genome id of every bird, None if unknown
+        :param jumps: (frames, bytes per frame) array of packed jump bits, None for an empty recording
+        :param fitness: fitness of every bird at the end of the game, None if unknown
+        :return: None
+        """
+        self.course_seed = course_seed
+        self.size = size
+        self.generation = generation
+        self.genome_ids = genome_ids
+        self.fitness = fitness
+        self.rows = [] if jumps is None else list(jumps)
+        self.mask = np.zeros(size, dtype=bool)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def record(self, jumped):
+        """
+        adds a frame to the recording
+        :param jumped: indices of the birds that jumped this frame
+        :return: None
+        """
+        self.mask[:] = False
+        self.mask[jumped] = True
+        self.rows.append(np.packbits(self.mask))
+
+    def jumps(self, frame):
+        """
+        :param frame: frame number, starting at 0 (int)
+        :return: indices of the birds that jumped in that frame
+        """
+        return np.flatnonzero(np.unpackbits(self.rows[frame], count=self.size))
+
+    def save(self, filename):
+        """
+        writes the recording to a compressed file
+        :param filename: path of the file
+        :return: None
+        """
+        meta = {
+            "format": FORMAT_VERSION,
+            "course_seed": self.course_seed,
+            "size": self.size,
+            "generation": self.generation,
+        }
+        arrays = {
+            "meta": np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+            "jumps": np.array(self.rows, dtype=np.uint8).reshape(len(self.rows), (self.size + 7) // 8),
+        }
+        if self.genome_ids is not None:
+            arrays["genome_ids"] = np.array(self.genome_ids, dtype=np.int64)
+        if self.fitness is not None:
+            arrays["fitness"] = np.asarray(self.fitness, dtype=np.float64)
+
+        with open(filename, "wb") as f:
+            np.savez_compressed(f, **arrays)
+
+    @staticmethod
+    def load(filename):
+        """
+        reads a recording written by save
+        :param filename: path of the file
+        :return: Recording
+        """
+        with np.load(filename) as data:
+            arrays = dict(data.items())
+        meta = json.loads(arrays["meta"].tobytes().decode("utf-8"))
+        if meta["format"] != FORMAT_VERSION:
+            raise ValueError("Unsupported replay format {0!r} in {1}".format(meta["format"], filename))
+
+        genome_ids = arrays["genome_ids"].tolist() if "genome_ids" in arrays else None
+        return Recording(meta["course_seed"], meta["size"], meta["generation"], genome_ids,
+                         arrays["jumps"], arrays.get("fitness"))
@@ -0,0 +1,182 @@
+"""
+Where the time of a generation goes.
+
+eval_genomes and Game take a PhaseTimer and call lap at the end of each
+phase of a frame, which adds the time since the previous lap to that
+phase: one perf_counter call and a dict update, cheap next to a frame.
+TimingReporter resets the timer when a generation starts and prints and
+logs its breakdown when the generation ends.
+"""
+import json
+import time
+
+import neat
+
+
+# waiting is the frame rate cap sleeping when a game is watched
+PHASES = ("setup", "events", "waiting", "physics", "activation", "collision", "pipes", "drawing", "other")
+
+
+class PhaseTimer:
+    """
+    accumulates the seconds spent in each phase of the game loop, the
+    frames and bird-frames simulated, and the best score of the games
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        forgets everything measured so far
+        :return: None
+        """
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.frames = 0
+        self.bird_frames = 0
+        self.score = 0
+        self.mark = time.perf_counter()
+
+    def start(self):
+        """
+        starts timing from now, the time before it isn't counted
+        :return: None
+        """
+        self.mark = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        adds the time since the last lap (or start) to a phase
+        :param phase: one of PHASES
+        :return: None
+        """
+        now = time.perf_counter()
+        self.seconds[phase] += now - self.mark
+        self.mark = now
+
+    def count(self, birds):
+        """
+        counts a simulated frame
+        :param birds: number of live birds in it (int)
+        :return: None
+        """
+        self.frames += 1
+        self.bird_frames += birds
+
+    def scored(self, score):
+        """
+        counts the score a game ended with
+        :param score: pipes passed (int)
+        :return: None
+        """
+        self.score = max(self.score, score)
+
+    def add(self, other):
+        """
+        adds what another timer measured, like one of a worker process
+        :param other: PhaseTimer
+        :return: None
+        """
+        for phase, seconds in other.seconds.items():
+            self.seconds[phase] += seconds
+        self.frames += other.frames
+        self.bird_frames += other.bird_frames
+        # shards of a generation play the same game, the best of them got furthest
+        self.score = max(self.score, other.score)
+
+
+class NullTimer(PhaseTimer):
+    """
+    a timer that measures nothing, for when nobody is looking
+    """
+
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def count(self, birds):
+        pass
+
+    def scored(self, score):
+        pass
+
+
+NO_TIMER = NullTimer()
+
+
+class TimingReporter(neat.reporting.BaseReporter):
+    """
+    prints, and optionally logs as JSON lines, how long each phase of
+    every generation's evaluation took. With worker processes the phases
+    add up the time of every worker, so they can add up to more than the
+    wall time.
+    """
+
+    def __init__(self, timer, filename=None):
+        """
+        Initialize the reporter
+        :param timer: PhaseTimer eval_genomes is given
+        :param filename: file to append one JSON line per generation to, None to only print
+        :return: None
+        """
+        self.timer = timer
+        self.filename = filename
+        self.history = []
+        self.generation = None
+        self.generation_start = None
+        self.evaluated = None
+        self.pending = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+        self.timer.reset()
+        self.generation_start = time.perf_counter()
+
+    def post_evaluate(self, config, population, species, best_genome):
+        self.evaluated = time.perf_counter()
+        self.pending = {
+            "generation": self.generation,
+            "wall": self.evaluated - self.generation_start,
+            "frames": self.timer.frames,
+            "bird_frames": self.timer.bird_frames,
+            "phases": dict(self.timer.seconds),
+            "reproduction": None,
+        }
+
+    def end_generation(self, config, population, species_set):
+        if self.pending is not None:
+            self.pending["reproduction"] = time.perf_counter() - self.evaluated
+            self.report(self.pending)
+            self.pending = None
+
+    def found_solution(self, config, generation, best):
+        # the last generation doesn't reproduce, so it never gets to end_generation
+        if self.pending is not None:
+            self.report(self.pending)
+            self.pending = None
+
+    def report(self, entry):
+        """
+        prints and logs the timing of a generation
+        :param entry: dict made by post_evaluate
+        :return: None
+        """
+        self.history.append(entry)
+
+        wall = entry["wall"]
+        rate = entry["frames"] / wall if wall > 0 else 0.0
+        print(" Evaluation time: {0:.3f} sec, {1} frames ({2:.1f} frames/sec), {3} bird-frames".format(
+            wall, entry["frames"], rate, entry["bird_frames"]))
+        measured = sum(entry["phases"].values())
+        for phase in PHASES:
+            seconds = entry["phases"][phase]
+            share = 100.0 * seconds / measured if measured > 0 else 0.0
+            print("    {0:<11} {1:8.3f} sec {2:5.1f}%".format(phase, seconds, share))
+        if entry["reproduction"] is not None:
+            print("    {0:<11} {1:8.3f} sec".format("reproduce", entry["reproduction"]))
+
+        if self.filename:
+            with open(self.filename, "a") as f:
+                f.write(json.dumps(entry) + "\n")
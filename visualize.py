@@ -3,21 +3,56 @@ from __future__ import print_function
 import copy
 import warnings
 
-import graphviz
-import matplotlib.pyplot as plt
 import numpy as np
 
 
+# matplotlib and graphviz are slow to import and only needed to draw, so
+# they are imported by the first plot rather than with this module
+
+
+def pyplot():
+    """ Imports matplotlib.pyplot, or returns None if it isn't installed. """
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return None
+    return plt
+
+
+def graphviz_module():
+    """ Imports graphviz, or returns None if it isn't installed. """
+    try:
+        import graphviz
+    except ImportError:
+        return None
+    return graphviz
+
+
 def plot_stats(statistics, ylog=False, view=False, filename='avg_fitness.svg'):
     """ Plots the population's average and best fitness. """
-    if plt is None:
-        warnings.warn("This display is not available due to a missing optional dependency (matplotlib)")
-        return
-
     generation = range(len(statistics.most_fit_genomes))
     best_fitness = [c.fitness for c in statistics.most_fit_genomes]
     avg_fitness = np.array(statistics.get_fitness_mean())
     stdev_fitness = np.array(statistics.get_fitness_stdev())
+    plot_fitness(generation, best_fitness, avg_fitness, stdev_fitness, ylog, view, filename)
+
+
+def plot_stats_file(metrics_file, ylog=False, view=False, filename='avg_fitness.svg'):
+    """ Plots the average and best fitness from a metrics log, see metrics.MetricsReporter. """
+    from metrics import read_metrics
+
+    generations, species = read_metrics(metrics_file)
+    plot_fitness(generations["generation"], generations["best"], generations["mean"], generations["stdev"],
+                 ylog, view, filename)
+
+
+def plot_fitness(generation, best_fitness, avg_fitness, stdev_fitness, ylog=False, view=False,
+                 filename='avg_fitness.svg'):
+    """ Plots average and best fitness, one value per generation. """
+    plt = pyplot()
+    if plt is None:
+        warnings.warn("This display is not available due to a missing optional dependency (matplotlib)")
+        return
 
     plt.plot(generation, avg_fitness, 'b-', label="average")
     plt.plot(generation, avg_fitness - stdev_fitness, 'g-.', label="-1 sd")
@@ -41,6 +76,11 @@ def plot_stats(statistics, ylog=False, view=False, filename='avg_fitness.svg'):
 
 def plot_spikes(spikes, view=False, filename=None, title=None):
     """ Plots the trains for a single spiking neuron. """
+    plt = pyplot()
+    if plt is None:
+        warnings.warn("This display is not available due to a missing optional dependency (matplotlib)")
+        return
+
     t_values = [t for t, I, v, u, f in spikes]
     v_values = [v for t, I, v, u, f in spikes]
     u_values = [u for t, I, v, u, f in spikes]
@@ -90,16 +130,34 @@ def plot_spikes(spikes, view=False, filename=None, title=None):
 
 def plot_species(statistics, view=False, filename='speciation.svg'):
     """ Visualizes speciation throughout evolution. """
+    species_sizes = statistics.get_species_sizes()
+    plot_species_sizes(range(len(species_sizes)), np.array(species_sizes).T, view, filename)
+
+
+def plot_species_file(metrics_file, view=False, filename='speciation.svg'):
+    """ Visualizes speciation from a metrics log, see metrics.MetricsReporter. """
+    from metrics import read_metrics
+
+    generations, species = read_metrics(metrics_file)
+    generation = generations["generation"]
+    # one row per species, the size in every generation logged so far
+    ids = np.unique(species["species"])
+    sizes = np.zeros((len(ids), len(generation)), dtype=np.int64)
+    logged = np.isin(species["generation"], generation)
+    sizes[np.searchsorted(ids, species["species"][logged]),
+          np.searchsorted(generation, species["generation"][logged])] = species["size"][logged]
+    plot_species_sizes(generation, sizes, view, filename)
+
+
+def plot_species_sizes(generation, curves, view=False, filename='speciation.svg'):
+    """ Plots the size of every species, one curve per species. """
+    plt = pyplot()
     if plt is None:
         warnings.warn("This display is not available due to a missing optional dependency (matplotlib)")
         return
 
-    species_sizes = statistics.get_species_sizes()
-    num_generations = len(species_sizes)
-    curves = np.array(species_sizes).T
-
     fig, ax = plt.subplots()
-    ax.stackplot(range(num_generations), *curves)
+    ax.stackplot(generation, *curves)
 
     plt.title("Speciation")
     plt.ylabel("Size per Species")
@@ -117,6 +175,7 @@ def draw_net(config, genome, view=False, filename=None, node_names=None, show_di
              node_colors=None, fmt='svg'):
     """ Receives a genome and draws a neural network with arbitrary topology. """
     # Attributes for network nodes.
+    graphviz = graphviz_module()
     if graphviz is None:
         warnings.warn("This display is not available due to a missing optional dependency (graphviz)")
         return